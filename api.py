@@ -1,11 +1,31 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import hashlib
+import json
+import secrets
+import time
+import uuid
+from collections import deque
+from fastapi import FastAPI, HTTPException, Header, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field
 from typing import List, Optional, Dict, Any
+from typing_extensions import Annotated
 import os
 from dotenv import load_dotenv
 import google.generativeai as genai
-from utils import setup_openai, process_guided_questionnaire, process_direct_question
+from utils import (
+    setup_openai, process_guided_questionnaire, process_direct_question, stream_direct_question,
+    submit_guided_sections, section_result, section_failed, stitch_guided_sections,
+    gate_input, gate_questionnaire, remember_response, get_gate_stats, key_pool,
+    MAX_QUESTION_CHARS, MAX_ANSWER_CHARS, MAX_ANSWERS, MAX_HISTORY_MESSAGES, MAX_MESSAGE_CHARS
+)
+from scheduler import (
+    scheduler, INTERACTIVE, GUIDED, PRIORITY_BY_NAME, QueueFullError, PreemptedError
+)
+from jobs import job_manager, JobQueueFullError
+from deadlines import Deadline, DeadlineExceeded
+from usage import usage_meter, set_usage_labels
 import requests
 
 # Load environment variables
@@ -30,23 +50,47 @@ app.add_middleware(
 # Initialize Gemini API
 setup_openai()
 
+# WebSocket flow control
+WS_SEND_BUFFER = int(os.getenv("WS_SEND_BUFFER", "64"))
+WS_SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "30"))
+WS_MAX_MESSAGES_PER_MINUTE = int(os.getenv("WS_MAX_MESSAGES_PER_MINUTE", "30"))
+
+# Client API keys accepted in X-API-Key; keys are not verified when empty
+CLIENT_API_KEYS = {key.strip() for key in os.getenv("CLIENT_API_KEYS", "").split(",") if key.strip()}
+
 # Pydantic models for request/response
 class ChatMessage(BaseModel):
-    role: str
-    content: str
+    role: str = Field(..., max_length=20)
+    content: str = Field(..., max_length=MAX_MESSAGE_CHARS)
 
 class DirectQuestionRequest(BaseModel):
-    question: str
-    project_type: str = "pm"
-    chat_history: Optional[List[ChatMessage]] = None
+    question: str = Field(..., max_length=MAX_QUESTION_CHARS)
+    project_type: str = Field("pm", max_length=10)
+    chat_history: Optional[List[ChatMessage]] = Field(None, max_length=MAX_HISTORY_MESSAGES)
 
 class GuidedQuestionnaireRequest(BaseModel):
-    responses: Dict[str, str]
-    project_type: str = "pm"
+    responses: Dict[Annotated[str, Field(max_length=100)], Annotated[str, Field(max_length=MAX_ANSWER_CHARS)]] = Field(
+        ..., max_length=MAX_ANSWERS
+    )
+    project_type: str = Field("pm", max_length=10)
+    sectioned: bool = False
+
+class GuidedQuestionnaireJobRequest(GuidedQuestionnaireRequest):
+    callback_url: Optional[str] = None
 
 class APIResponse(BaseModel):
     response: str
 
+class JobResponse(BaseModel):
+    job_id: str
+    status: str
+    result: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    callback_status: Optional[Any] = None
+
 class IntegrationRequest(BaseModel):
     project_id: str
     project_data: Dict[str, Any]
@@ -57,39 +101,555 @@ class IntegrationResponse(BaseModel):
     message: str
     data: Optional[Dict[str, Any]] = None
 
+def client_key_id(api_key: str) -> str:
+    """Stable identifier of a client API key, used in its place as tenant and TENANT_WEIGHTS key"""
+    return "key-" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:16]
+
+def resolve_tenant(api_key: Optional[str], tenant_id: Optional[str]) -> str:
+    """
+    Identify the tenant a request is charged to for fair scheduling.
+
+    When CLIENT_API_KEYS is set, X-API-Key must be one of those keys and
+    requests without a key share the "anonymous" tenant, so a client cannot get
+    a fresh fair share by rotating keys or tenant ids. Without it neither header
+    is verified and both only separate cooperating clients.
+    """
+    if api_key:
+        if CLIENT_API_KEYS and api_key not in CLIENT_API_KEYS:
+            raise HTTPException(status_code=401, detail="Invalid API key")
+        return client_key_id(api_key)
+    if CLIENT_API_KEYS:
+        return "anonymous"
+    return tenant_id or "anonymous"
+
+def resolve_session(session_id: Optional[str], tenant: str) -> Optional[str]:
+    """
+    Session used for duplicate-submit detection. Without an X-Session-ID there is
+    no session: callers sharing a tenant (e.g. all anonymous clients) are
+    different users and must not see each other's answers as duplicates.
+    """
+    return f"{tenant}:{session_id}" if session_id else None
+
+def label_usage(endpoint: str, tenant: str, session_id: Optional[str], project_type: Optional[str] = None):
+    """Set the labels the token usage of this request is charged to, see usage.py"""
+    set_usage_labels(
+        endpoint=endpoint,
+        tenant=tenant,
+        session=session_id,
+        project_type=project_type
+    )
+
+def require_admin(token: Optional[str]):
+    """Reject requests without the ADMIN_TOKEN; admin endpoints are off when it is not set"""
+    admin_token = os.getenv("ADMIN_TOKEN")
+    if not admin_token:
+        raise HTTPException(status_code=403, detail="Admin endpoints are disabled")
+    if not token or not secrets.compare_digest(token, admin_token):
+        raise HTTPException(status_code=401, detail="Invalid admin token")
+
+def resolve_priority(default: int, requested: Optional[str]) -> int:
+    """Clients may lower the priority of their own work (e.g. to "batch") but never raise it"""
+    if requested and requested.lower() in PRIORITY_BY_NAME:
+        return max(default, PRIORITY_BY_NAME[requested.lower()])
+    return default
+
+async def run_scheduled(fn, priority: int, tenant: str, http_request: Optional[Request] = None,
+                        deadline: Optional[Deadline] = None, **kwargs):
+    """
+    Run a model-backed call through the scheduler without blocking the event loop.
+    The deadline is cancelled when the client disconnects, which drops queued work
+    and stops a running generation at its next chunk.
+    """
+    deadline = deadline or Deadline()
+    try:
+        future = scheduler.submit(fn, priority=priority, tenant=tenant, deadline=deadline, **kwargs)
+    except (QueueFullError, PreemptedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    waiter = asyncio.wrap_future(future)
+    while True:
+        done, _ = await asyncio.wait({waiter}, timeout=0.5)
+        if done:
+            break
+        if http_request is not None and await http_request.is_disconnected():
+            deadline.cancel()
+            future.cancel()
+            raise HTTPException(status_code=499, detail="Client closed request")
+        if deadline.expired() and future.cancel():
+            raise HTTPException(status_code=504, detail="Request deadline exceeded while queued")
+
+    try:
+        return waiter.result()
+    except (QueueFullError, PreemptedError) as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    except DeadlineExceeded as e:
+        raise HTTPException(status_code=504, detail=str(e))
+
+def queue_sections(responses: Dict[str, str], project_type: str, deadline: Deadline, priority: int, tenant: str):
+    """Queue the sections of a guided report on the scheduler, see submit_guided_sections"""
+    try:
+        return submit_guided_sections(responses, project_type, deadline, priority=priority, tenant=tenant)
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+class ClosingStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that calls `on_close` however the response ends. A body
+    generator's own finally block does not run when the client goes away before
+    the body is started.
+    """
+
+    def __init__(self, content, on_close, **kwargs):
+        super().__init__(content, **kwargs)
+        self.on_close = on_close
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.on_close()
+
+async def finished_sections(submitted, deadline: Deadline, http_request: Optional[Request] = None):
+    """
+    Yield (index, key, title, text) for queued sections as they finish. Sections
+    still queued or running are stopped when the caller goes away.
+    """
+    waiters = {asyncio.wrap_future(future): (index, section, future) for index, section, future in submitted}
+    pending = set(waiters)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=0.5, return_when=asyncio.FIRST_COMPLETED)
+            for waiter in done:
+                index, section, future = waiters[waiter]
+                yield index, section["key"], section["title"], section_result(future)
+            if pending and http_request is not None and await http_request.is_disconnected():
+                raise HTTPException(status_code=499, detail="Client closed request")
+    finally:
+        if pending:
+            deadline.cancel()
+            for _, _, future in submitted:
+                future.cancel()
+
 # Existing endpoints
 @app.get("/")
 async def root():
     return {"message": "Welcome to the Project Management Chatbot API"}
 
 @app.post("/api/direct-question", response_model=APIResponse)
-async def ask_direct_question(request: DirectQuestionRequest):
+async def ask_direct_question(
+    request: DirectQuestionRequest,
+    http_request: Request,
+    x_api_key: Optional[str] = Header(None),
+    x_tenant_id: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+    x_session_id: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None)
+):
     """
     Process a direct question from the user
     """
+    tenant = resolve_tenant(x_api_key, x_tenant_id)
+    session = resolve_session(x_session_id, tenant)
+    chat_history = [
+        {"role": msg.role, "content": msg.content} for msg in request.chat_history
+    ] if request.chat_history else None
+    reply, _ = gate_input(request.question, session_id=session, chat_history=chat_history)
+    if reply is not None:
+        return APIResponse(response=reply)
+    label_usage("direct-question", tenant, x_session_id, request.project_type)
+
+    response = None
     try:
-        response = process_direct_question(
+        response = await run_scheduled(
+            process_direct_question,
+            priority=resolve_priority(INTERACTIVE, x_priority),
+            tenant=tenant,
+            http_request=http_request,
+            deadline=Deadline.from_header(x_request_timeout),
             question=request.question,
-            chat_history=request.chat_history,
+            chat_history=chat_history,
             project_type=request.project_type
         )
         return APIResponse(response=response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        remember_response(session, request.question, response, chat_history=chat_history)
 
 @app.post("/api/guided-questionnaire", response_model=APIResponse)
-async def process_questionnaire(request: GuidedQuestionnaireRequest):
+async def process_questionnaire(
+    request: GuidedQuestionnaireRequest,
+    http_request: Request,
+    x_api_key: Optional[str] = Header(None),
+    x_tenant_id: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+    x_session_id: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None)
+):
     """
     Process responses from the guided questionnaire
     """
+    tenant = resolve_tenant(x_api_key, x_tenant_id)
+    session = resolve_session(x_session_id, tenant)
+    responses, reply, _ = gate_questionnaire(request.responses, session_id=session)
+    if reply is not None:
+        return APIResponse(response=reply)
+    label_usage("guided-questionnaire", tenant, x_session_id, request.project_type)
+
+    priority = resolve_priority(GUIDED, x_priority)
+    deadline = Deadline.from_header(x_request_timeout)
+    response = None
     try:
-        response = process_guided_questionnaire(
-            responses=request.responses,
-            project_type=request.project_type
-        )
+        if request.sectioned:
+            # Each section is its own scheduler job; the handler only stitches
+            sections = {}
+            submitted = queue_sections(responses, request.project_type, deadline, priority, tenant)
+            async for _, key, _, text in finished_sections(submitted, deadline, http_request):
+                sections[key] = text
+            response = stitch_guided_sections(sections, request.project_type)
+        else:
+            response = await run_scheduled(
+                process_guided_questionnaire,
+                priority=priority,
+                tenant=tenant,
+                http_request=http_request,
+                deadline=deadline,
+                responses=responses,
+                project_type=request.project_type
+            )
         return APIResponse(response=response)
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        remember_response(session, responses, response)
+
+@app.post("/api/guided-questionnaire/stream")
+async def stream_questionnaire(
+    request: GuidedQuestionnaireRequest,
+    x_api_key: Optional[str] = Header(None),
+    x_tenant_id: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None),
+    x_session_id: Optional[str] = Header(None),
+    x_request_timeout: Optional[str] = Header(None)
+):
+    """
+    Generate the questionnaire report section by section and stream it as
+    newline-delimited JSON: one {"index", "key", "title", "text", "failed"} line
+    per section as soon as it is ready, then {"done": true, "failed": ..., "response": ...}.
+    If any section failed, the final response is the failure reply, not a report.
+    """
+    tenant = resolve_tenant(x_api_key, x_tenant_id)
+    session = resolve_session(x_session_id, tenant)
+    responses, reply, _ = gate_questionnaire(request.responses, session_id=session)
+    if reply is not None:
+        return StreamingResponse(
+            iter([json.dumps({"done": True, "failed": section_failed(reply), "response": reply},
+                             ensure_ascii=False) + "\n"]),
+            media_type="application/x-ndjson"
+        )
+
+    label_usage("guided-questionnaire-stream", tenant, x_session_id, request.project_type)
+
+    deadline = Deadline.from_header(x_request_timeout)
+    try:
+        submitted = queue_sections(responses, request.project_type, deadline, resolve_priority(GUIDED, x_priority), tenant)
+    except HTTPException:
+        # Nothing is running, so a retry must not be answered as a pending duplicate
+        remember_response(session, responses, None)
+        raise
+    result = {"response": None}
+
+    async def generate():
+        sections = {}
+        async for index, key, title, text in finished_sections(submitted, deadline):
+            sections[key] = text
+            yield json.dumps({"index": index, "key": key, "title": title, "text": text,
+                              "failed": section_failed(text)}, ensure_ascii=False) + "\n"
+        result["response"] = stitch_guided_sections(sections, request.project_type)
+        yield json.dumps({"done": True, "failed": section_failed(result["response"]),
+                          "response": result["response"]}, ensure_ascii=False) + "\n"
+
+    def close():
+        # Also runs when the client left before the body started: stop the
+        # sections and forget the submission unless a report was produced
+        deadline.cancel()
+        for _, _, future in submitted:
+            future.cancel()
+        remember_response(session, responses, result["response"])
+
+    return ClosingStreamingResponse(generate(), on_close=close, media_type="application/x-ndjson")
+
+@app.post("/api/guided-questionnaire/jobs", response_model=JobResponse, status_code=202)
+async def submit_questionnaire_job(
+    request: GuidedQuestionnaireJobRequest,
+    x_api_key: Optional[str] = Header(None),
+    x_tenant_id: Optional[str] = Header(None),
+    x_priority: Optional[str] = Header(None)
+):
+    """
+    Start generating the questionnaire report in the background and return a job id.
+    Poll /api/guided-questionnaire/jobs/{job_id} or pass a callback_url to be notified.
+    """
+    priority = resolve_priority(GUIDED, x_priority)
+    tenant = resolve_tenant(x_api_key, x_tenant_id)
+    responses, reply, _ = gate_questionnaire(request.responses)
+    if reply is not None:
+        raise HTTPException(status_code=400, detail=reply)
+    label_usage("guided-questionnaire-jobs", tenant, None, request.project_type)
+
+    def generate():
+        if request.sectioned:
+            # Runs on the job pool, which queues each section on the scheduler
+            result = process_guided_questionnaire(
+                responses, project_type=request.project_type, sectioned=True, priority=priority, tenant=tenant
+            )
+        else:
+            result = scheduler.run(
+                process_guided_questionnaire,
+                priority=priority,
+                tenant=tenant,
+                responses=responses,
+                project_type=request.project_type
+            )
+        # The generation reports failures as a reply text; fail the job with it
+        if section_failed(result):
+            raise RuntimeError(result)
+        return result
+
+    try:
+        # Validating the callback URL resolves its host, so keep it off the event loop
+        job = await asyncio.to_thread(job_manager.submit, generate, callback_url=request.callback_url)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    return JobResponse(**job)
+
+@app.get("/api/guided-questionnaire/jobs/{job_id}", response_model=JobResponse)
+async def get_questionnaire_job(job_id: str):
+    """
+    Get the status and, once finished, the result of a questionnaire job
+    """
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found or expired")
+    return JobResponse(**job)
+
+@app.websocket("/ws/chat")
+async def chat_websocket(websocket: WebSocket):
+    """
+    Persistent chat connection, one per conversation.
+
+    The client sends only new messages, the server keeps the history:
+        {"type": "message", "content": "...", "project_type": "pm", "timeout": 30}
+        {"type": "cancel"}
+    and receives the answer as a stream of events:
+        {"type": "start", "id": 1}, {"type": "token", "id": 1, "text": "..."},
+        {"type": "end", "id": 1} or {"type": "cancelled", "id": 1},
+        {"type": "error", "detail": "..."}
+
+    Flow control: one answer in flight per connection, a per-connection message
+    rate limit, and a bounded send buffer. The generation never waits for the
+    client, so a slow reader cannot hold a scheduler worker: an answer that fills
+    the buffer is cancelled, and a client that does not accept a frame within
+    WS_SEND_TIMEOUT seconds is disconnected.
+    """
+    try:
+        tenant = resolve_tenant(websocket.headers.get("x-api-key"), websocket.headers.get("x-tenant-id"))
+    except HTTPException:
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    connection_id = uuid.uuid4().hex
+    session = resolve_session(connection_id, tenant)
+    label_usage("ws-chat", tenant, connection_id)
+    default_project_type = websocket.query_params.get("project_type", "pm")
+    loop = asyncio.get_running_loop()
+    outbox = asyncio.Queue()
+    history = []
+    received_at = deque()
+    message_id = 0
+    in_flight = None
+
+    async def offer(event, force):
+        if not force and outbox.qsize() >= WS_SEND_BUFFER:
+            return False
+        outbox.put_nowait(event)
+        return True
+
+    def push(event, force=False):
+        # Called from the generation thread. Only waits for the event loop, never
+        # for the client; final events are always queued so the client sees them.
+        if not asyncio.run_coroutine_threadsafe(offer(event, force), loop).result():
+            raise DeadlineExceeded("Client is not reading")
+
+    def answer(answer_id, question, project_type, deadline):
+        set_usage_labels(project_type=project_type)
+        push({"type": "start", "id": answer_id})
+        chunks = []
+        try:
+            for text in stream_direct_question(question, chat_history=list(history),
+                                               project_type=project_type, deadline=deadline):
+                chunks.append(text)
+                push({"type": "token", "id": answer_id, "text": text})
+        except DeadlineExceeded:
+            remember_response(session, question, None, chat_history=history)
+            push({"type": "cancelled", "id": answer_id}, force=True)
+            return
+        except Exception as e:
+            remember_response(session, question, None, chat_history=history)
+            push({"type": "error", "id": answer_id, "detail": str(e)}, force=True)
+            return
+        response = "".join(chunks)
+        # Remembered before the history grows, matching the key gate_input used
+        remember_response(session, question, response, chat_history=history)
+        history.extend([
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": response}
+        ])
+        del history[:-MAX_HISTORY_MESSAGES]
+        push({"type": "end", "id": answer_id}, force=True)
+
+    async def sender():
+        while True:
+            event = await outbox.get()
+            try:
+                await asyncio.wait_for(websocket.send_json(event), timeout=WS_SEND_TIMEOUT)
+            except asyncio.TimeoutError:
+                # The client stopped reading; closing ends the receive loop below
+                await websocket.close(code=1008)
+                return
+
+    def dropped(answer_id, question, future):
+        # The scheduler dropped the job before it started (deadline or preemption)
+        if future.cancelled() or future.exception() is None:
+            return
+        remember_response(session, question, None, chat_history=history)
+        event = {"type": "error", "id": answer_id, "detail": str(future.exception())}
+        loop.call_soon_threadsafe(outbox.put_nowait, event)
+
+    sender_task = asyncio.create_task(sender())
+    try:
+        while True:
+            frame = await websocket.receive()
+            if frame["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(frame.get("code", 1000))
+            try:
+                data = json.loads(frame.get("text") or frame.get("bytes") or "")
+            except (ValueError, UnicodeDecodeError):
+                data = None
+            if not isinstance(data, dict):
+                await outbox.put({"type": "error", "detail": "Messages must be JSON objects"})
+                continue
+            kind = data.get("type", "message")
+
+            if kind == "cancel":
+                if in_flight is not None and not in_flight[1].done():
+                    in_flight[0].cancel()
+                    if in_flight[1].cancel():
+                        remember_response(session, in_flight[2], None, chat_history=history)
+                        await outbox.put({"type": "cancelled", "id": message_id})
+                continue
+            if kind != "message":
+                await outbox.put({"type": "error", "detail": f"Unknown message type: {kind}"})
+                continue
+
+            if in_flight is not None and not in_flight[1].done():
+                await outbox.put({"type": "error", "detail": "An answer is already in progress"})
+                continue
+            now = time.monotonic()
+            while received_at and now - received_at[0] > 60:
+                received_at.popleft()
+            if len(received_at) >= WS_MAX_MESSAGES_PER_MINUTE:
+                await outbox.put({"type": "error", "detail": "Too many messages, please slow down"})
+                continue
+            received_at.append(now)
+
+            question = str(data.get("content", ""))
+            message_id += 1
+            reply, _ = gate_input(question, session_id=session, chat_history=history)
+            if reply is not None:
+                for event in ({"type": "start", "id": message_id},
+                              {"type": "token", "id": message_id, "text": reply},
+                              {"type": "end", "id": message_id}):
+                    await outbox.put(event)
+                continue
+
+            deadline = Deadline(data["timeout"]) if isinstance(data.get("timeout"), (int, float)) else Deadline()
+            try:
+                future = scheduler.submit(
+                    answer, message_id, question, str(data.get("project_type") or default_project_type),
+                    priority=INTERACTIVE, tenant=tenant, deadline=deadline
+                )
+            except (QueueFullError, PreemptedError) as e:
+                remember_response(session, question, None, chat_history=history)
+                await outbox.put({"type": "error", "id": message_id, "detail": str(e)})
+                continue
+            future.add_done_callback(lambda f, answer_id=message_id, question=question: dropped(answer_id, question, f))
+            in_flight = (deadline, future, question)
+    except WebSocketDisconnect:
+        pass
+    finally:
+        if in_flight is not None:
+            in_flight[0].cancel()
+            in_flight[1].cancel()
+        sender_task.cancel()
+
+@app.get("/api/scheduler/stats")
+async def get_scheduler_stats():
+    """
+    Queue depth and wait-time metrics of the model call scheduler
+    """
+    return {**scheduler.stats(), "background_jobs": job_manager.stats()}
+
+@app.get("/api/keys/stats")
+async def get_key_pool_stats(x_admin_token: Optional[str] = Header(None)):
+    """
+    Per-key request, token, error and cooldown metrics of the API key pool.
+    Requires the X-Admin-Token header.
+    """
+    require_admin(x_admin_token)
+    return key_pool.stats()
+
+@app.get("/api/gate/stats")
+async def get_input_gate_stats():
+    """
+    Counters of the pre-model input gate, including how many model calls were avoided
+    """
+    return get_gate_stats()
+
+@app.get("/api/admin/usage")
+async def get_usage_report(
+    group_by: str = "tenant",
+    since: Optional[str] = None,
+    limit: int = 50,
+    session: Optional[str] = None,
+    tenant: Optional[str] = None,
+    endpoint: Optional[str] = None,
+    project_type: Optional[str] = None,
+    outcome: Optional[str] = None,
+    x_admin_token: Optional[str] = Header(None)
+):
+    """
+    Token usage and estimated cost grouped by session, tenant, endpoint,
+    project_type, model, request_class, outcome (ok, cancelled, error) or day,
+    optionally filtered by label and by first day (YYYY-MM-DD). Requires the
+    X-Admin-Token header.
+    """
+    require_admin(x_admin_token)
+    try:
+        report = await asyncio.to_thread(
+            usage_meter.report, group_by=group_by, since=since, limit=limit,
+            session=session, tenant=tenant, endpoint=endpoint, project_type=project_type,
+            outcome=outcome
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"group_by": group_by, "usage": report}
 
 # New integration endpoints
 @app.post("/api/integrate/project", response_model=IntegrationResponse)
@@ -1,8 +1,13 @@
+import uuid
 import streamlit as st
-from utils import setup_openai, process_guided_questionnaire, process_direct_question
+from utils import (
+    setup_openai, process_guided_questionnaire, process_direct_question, detect_project_type,
+    gate_input, gate_questionnaire, remember_response, MAX_QUESTION_CHARS, MAX_ANSWER_CHARS
+)
+from usage import set_usage_labels
 from prompts import (
     WELCOME_MESSAGE, PM_GUIDED_QUESTIONS, GP_GUIDED_QUESTIONS,
-    PROJECT_MANAGEMENT_ASPECTS, GRADUATION_PROJECT_CATEGORIES
+    PROJECT_MANAGEMENT_ASPECTS, GRADUATION_PROJECT_CATEGORIES, EMPTY_INPUT_RESPONSE
 )
 
 # Page configuration
@@ -42,8 +47,13 @@ st.markdown(
     unsafe_allow_html=True
 )
 
-# Initialize API
-setup_openai()
+# Initialize API once per server process instead of on every script run
+@st.cache_resource
+def init_api():
+    setup_openai()
+
+
+init_api()
 
 # Initialize session state variables
 if "messages" not in st.session_state:
@@ -64,6 +74,121 @@ if "questionnaire_responses" not in st.session_state:
 if "welcome_shown" not in st.session_state:
     st.session_state.welcome_shown = False
 
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+
+if "questionnaire_error" not in st.session_state:
+    st.session_state.questionnaire_error = None
+
+# Count script executions per user action: full runs re-execute this whole file,
+# fragment runs only re-execute the questionnaire region
+if "run_stats" not in st.session_state:
+    st.session_state.run_stats = {"actions": 0, "script_runs": 0, "fragment_runs": 0}
+st.session_state.run_stats["script_runs"] += 1
+
+DIRECT_MODE_WELCOME = "مرحباً بك في نمط الطريقة المباشرة. يمكنك الآن طرح سؤالك مباشرة حول إدارة المشاريع البرمجية أو مشاريع التخرج، وسأقوم بمساعدتك."
+
+# Input widgets of the questionnaire answers that are not free text
+ANSWER_WIDGETS = {
+    "pm": {
+        "experience": ("radio", ["مبتدئ", "متوسط", "متقدم"], 1),
+        "project_type": ("selectbox", ["تطوير برمجيات", "تطوير تطبيقات موبايل", "تطوير مواقع", "تطوير واجهات مستخدم", 
+                                       "تطوير واجهات برمجة التطبيقات", "تطوير قواعد بيانات", "تطوير ذكاء اصطناعي", 
+                                       "تطوير أمن معلومات", "تطوير ألعاب", "تطوير أنظمة مدمجة", "تطوير خدمات سحابية", 
+                                       "تطوير DevOps", "تطوير Blockchain", "تطوير IoT", "تطوير AR/VR", "أخرى"], 0),
+        "team_size": ("number", (1, 100, 5), None),
+        "project_phase": ("radio", ["التخطيط", "التطوير", "الاختبار", "النشر", "الصيانة", "التقييم", "الإغلاق"], 0),
+        "methodology": ("selectbox", ["أجايل", "ووترفول", "هجين", "Scrum", "Kanban", "Lean", "DevOps", "Six Sigma", 
+                                      "Prince2", "PMP", "ITIL", "COBIT", "أخرى"], 0),
+    },
+    "gp": {
+        "field_of_study": ("selectbox", ["علوم الحاسوب", "هندسة البرمجيات", "هندسة الحاسوب", "نظم المعلومات", 
+                                         "تكنولوجيا المعلومات", "الذكاء الاصطناعي", "علم البيانات", "أمن المعلومات",
+                                         "الشبكات", "هندسة كهربائية", "هندسة الاتصالات", "هندسة إلكترونية", "أخرى"], 0),
+        "team_size": ("number", (1, 10, 3), None),
+        "duration": ("radio", ["فصل دراسي واحد", "فصلين دراسيين", "سنة كاملة"], 1),
+        "preferences": ("radio", ["مشروع عملي", "مشروع بحثي", "مزيج من الاثنين"], 0),
+    },
+}
+
+
+# Widget callbacks. They run before the rerun that a click triggers, so the
+# rerun already renders the new state and no extra st.rerun() is needed.
+def record_action():
+    st.session_state.run_stats["actions"] += 1
+
+
+def start_guided_mode():
+    record_action()
+    st.session_state.chat_mode = "guided"
+    st.session_state.questionnaire_step = 1 if st.session_state.project_type else 0
+    st.session_state.questionnaire_responses = {}
+    st.session_state.questionnaire_error = None
+
+
+def start_direct_mode():
+    record_action()
+    st.session_state.chat_mode = "direct"
+    if not st.session_state.messages:
+        st.session_state.messages.append({"role": "assistant", "content": DIRECT_MODE_WELCOME})
+
+
+def select_project_type(project_type):
+    record_action()
+    st.session_state.project_type = project_type
+    if st.session_state.chat_mode == "guided":
+        st.session_state.questionnaire_step = 1  # Skip the initial project selection
+        st.session_state.questionnaire_responses = {}
+        st.session_state.questionnaire_error = None
+
+
+def submit_answer(field, widget_key, free_text):
+    record_action()
+    value = st.session_state[widget_key]
+    if free_text and not value.strip():
+        st.session_state.questionnaire_error = EMPTY_INPUT_RESPONSE
+        return
+    st.session_state.questionnaire_error = None
+    st.session_state.questionnaire_responses[field] = str(value)
+    st.session_state.questionnaire_step += 1
+
+
+def previous_question():
+    record_action()
+    st.session_state.questionnaire_error = None
+    st.session_state.questionnaire_step -= 1
+
+
+def restart_questionnaire():
+    record_action()
+    st.session_state.questionnaire_step = 0
+    st.session_state.questionnaire_responses = {}
+    st.session_state.questionnaire_error = None
+    st.session_state.project_type = None
+
+
+def clear_chat():
+    record_action()
+    st.session_state.messages = []
+    st.session_state.questionnaire_responses = {}
+    st.session_state.questionnaire_step = 0
+    st.session_state.questionnaire_error = None
+    st.session_state.welcome_shown = False
+    st.session_state.chat_mode = None
+    st.session_state.project_type = None
+
+
+def ask_topic(topic_type, topic):
+    record_action()
+    st.session_state.chat_mode = "direct"
+    if topic_type == "pm":
+        query = f"أخبرني المزيد عن {topic}"
+    else:
+        query = f"اقترح علي أفكار لمشاريع تخرج في مجال {topic}"
+    
+    st.session_state.project_type = topic_type
+    st.session_state.messages.append({"role": "user", "content": query})
+
 
 def display_welcome():
     """Display welcome message and mode selection"""
@@ -77,22 +202,44 @@ def display_welcome():
     col1, col2 = st.columns(2)
     
     with col1:
-        if st.button("الاستبيان الموجه", use_container_width=True):
-            st.session_state.chat_mode = "guided"
-            st.session_state.questionnaire_step = 0
-            st.session_state.questionnaire_responses = {}
-            st.rerun()
+        st.button("الاستبيان الموجه", use_container_width=True, on_click=start_guided_mode)
     
     with col2:
-        if st.button("الطريقة المباشرة", use_container_width=True):
-            st.session_state.chat_mode = "direct"
-            welcome_msg = "مرحباً بك في نمط الطريقة المباشرة. يمكنك الآن طرح سؤالك مباشرة حول إدارة المشاريع البرمجية أو مشاريع التخرج، وسأقوم بمساعدتك."
-            st.session_state.messages.append({"role": "assistant", "content": welcome_msg})
-            st.rerun()
+        st.button("الطريقة المباشرة", use_container_width=True, on_click=start_direct_mode)
+
+
+def render_answer_widget(project_type, field, label, widget_key):
+    """Render the input widget for a questionnaire answer, returns True for free text"""
+    kind, options, index = ANSWER_WIDGETS[project_type].get(field, ("text", None, None))
+    if kind == "radio":
+        st.radio(label, options, index=index, key=widget_key, label_visibility="collapsed")
+    elif kind == "selectbox":
+        st.selectbox(label, options, index=index, key=widget_key, label_visibility="collapsed")
+    elif kind == "number":
+        min_value, max_value, value = options
+        st.number_input(label, min_value=min_value, max_value=max_value, value=value, step=1,
+                        key=widget_key, label_visibility="collapsed")
+    else:
+        st.text_area(label, key=widget_key, height=100, max_chars=MAX_ANSWER_CHARS, label_visibility="collapsed")
+    return kind == "text"
 
 
+@st.fragment
 def run_guided_questionnaire():
-    """Run the guided questionnaire mode"""
+    """
+    Run the guided questionnaire mode
+
+    Runs as a fragment: answering a question only re-executes this function,
+    not the whole script with the sidebar and page setup.
+    """
+    st.session_state.run_stats["fragment_runs"] += 1
+    display_questionnaire()
+    # Shown here rather than in the sidebar, which fragment runs do not redraw
+    display_run_stats()
+
+
+def display_questionnaire():
+    """Display the current questionnaire step or the summary of the answers"""
     # Determine context based on previous answers
     if not st.session_state.project_type and st.session_state.questionnaire_step == 0:
         # First question determines project type
@@ -101,15 +248,9 @@ def run_guided_questionnaire():
         
         col1, col2 = st.columns(2)
         with col1:
-            if st.button("إدارة المشاريع البرمجية", use_container_width=True):
-                st.session_state.project_type = "pm"
-                st.session_state.questionnaire_step = 1
-                st.rerun()
+            st.button("إدارة المشاريع البرمجية", use_container_width=True, on_click=select_project_type, args=("pm",))
         with col2:
-            if st.button("مشاريع التخرج", use_container_width=True):
-                st.session_state.project_type = "gp"
-                st.session_state.questionnaire_step = 1
-                st.rerun()
+            st.button("مشاريع التخرج", use_container_width=True, on_click=select_project_type, args=("gp",))
         return
     
     # Get appropriate questions based on project type
@@ -134,128 +275,48 @@ def run_guided_questionnaire():
         
         st.markdown(f"<h3 style='direction: rtl; text-align: right;'>{current_question}</h3>", unsafe_allow_html=True)
         
-        # Project management specific handlers
-        if project_type == "pm":
-            # Special case for experience (radio)
-            if current_field == "experience":
-                experience = st.radio("", ["مبتدئ", "متوسط", "متقدم"], index=1, key="experience_radio")
-                if st.button("التالي", key="next_experience"):
-                    st.session_state.questionnaire_responses[current_field] = experience
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
-                
-            # Special case for project_type (dropdown)
-            elif current_field == "project_type":
-                project_type_options = ["تطوير برمجيات", "تطوير تطبيقات موبايل", "تطوير مواقع", "تطوير واجهات مستخدم", 
-                                      "تطوير واجهات برمجة التطبيقات", "تطوير قواعد بيانات", "تطوير ذكاء اصطناعي", 
-                                      "تطوير أمن معلومات", "تطوير ألعاب", "تطوير أنظمة مدمجة", "تطوير خدمات سحابية", 
-                                      "تطوير DevOps", "تطوير Blockchain", "تطوير IoT", "تطوير AR/VR", "أخرى"]
-                project_type_val = st.selectbox("", project_type_options, index=0, key="project_type_select")
-                if st.button("التالي", key="next_project_type"):
-                    st.session_state.questionnaire_responses[current_field] = project_type_val
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
-                    
-            # Special case for team size (number input)
-            elif current_field == "team_size":
-                team_size = st.number_input("", min_value=1, max_value=100, value=5, step=1, key="team_size_input")
-                if st.button("التالي", key="next_team_size"):
-                    st.session_state.questionnaire_responses[current_field] = str(team_size)
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
-                    
-            # Special case for project_phase (radio)
-            elif current_field == "project_phase":
-                project_phase = st.radio("", ["التخطيط", "التطوير", "الاختبار", "النشر", "الصيانة", "التقييم", "الإغلاق"], index=0, key="project_phase_radio")
-                if st.button("التالي", key="next_project_phase"):
-                    st.session_state.questionnaire_responses[current_field] = project_phase
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
-                    
-            # Special case for methodology (dropdown)
-            elif current_field == "methodology":
-                methodology = st.selectbox("", ["أجايل", "ووترفول", "هجين", "Scrum", "Kanban", "Lean", "DevOps", "Six Sigma", "Prince2", "PMP", "ITIL", "COBIT", "أخرى"], index=0, key="methodology_select")
-                if st.button("التالي", key="next_methodology"):
-                    st.session_state.questionnaire_responses[current_field] = methodology
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
-                    
-            # For other fields (text input)
-            else:
-                user_input = st.text_area("", key=f"input_{current_field}", height=100)
-                if st.button("التالي", key=f"next_{current_field}"):
-                    st.session_state.questionnaire_responses[current_field] = user_input
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
-                    
-        # Graduation project specific handlers
-        else:
-            # Special case for field_of_study (dropdown)
-            if current_field == "field_of_study":
-                fields = ["علوم الحاسوب", "هندسة البرمجيات", "هندسة الحاسوب", "نظم المعلومات", 
-                        "تكنولوجيا المعلومات", "الذكاء الاصطناعي", "علم البيانات", "أمن المعلومات",
-                        "الشبكات", "هندسة كهربائية", "هندسة الاتصالات", "هندسة إلكترونية", "أخرى"]
-                field = st.selectbox("", fields, index=0, key="field_study_select")
-                if st.button("التالي", key="next_field"):
-                    st.session_state.questionnaire_responses[current_field] = field
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
-                    
-            # Special case for team_size (number input)
-            elif current_field == "team_size":
-                team_size = st.number_input("", min_value=1, max_value=10, value=3, step=1, key="gp_team_size_input")
-                if st.button("التالي", key="next_team_size"):
-                    st.session_state.questionnaire_responses[current_field] = str(team_size)
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
-                    
-            # Special case for duration (radio)
-            elif current_field == "duration":
-                duration = st.radio("", ["فصل دراسي واحد", "فصلين دراسيين", "سنة كاملة"], index=1, key="duration_radio")
-                if st.button("التالي", key="next_duration"):
-                    st.session_state.questionnaire_responses[current_field] = duration
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
-                    
-            # Special case for preferences (radio)
-            elif current_field == "preferences":
-                preference = st.radio("", ["مشروع عملي", "مشروع بحثي", "مزيج من الاثنين"], index=0, key="preferences_radio")
-                if st.button("التالي", key="next_preferences"):
-                    st.session_state.questionnaire_responses[current_field] = preference
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
-                    
-            # For other fields (text input)
-            else:
-                user_input = st.text_area("", key=f"input_{current_field}", height=100)
-                if st.button("التالي", key=f"next_{current_field}"):
-                    st.session_state.questionnaire_responses[current_field] = user_input
-                    st.session_state.questionnaire_step += 1
-                    st.rerun()
+        # The answer is only sent when the form is submitted, so changing the
+        # widget value does not trigger any rerun
+        widget_key = f"answer_{project_type}_{current_field}"
+        with st.form(key=f"form_{project_type}_{current_field}", border=False):
+            free_text = render_answer_widget(project_type, current_field, current_question, widget_key)
+            st.form_submit_button(
+                "التالي", on_click=submit_answer, args=(current_field, widget_key, free_text)
+            )
+        
+        if st.session_state.questionnaire_error:
+            st.warning(st.session_state.questionnaire_error)
         
         # Add back button if not on the first question
         if st.session_state.questionnaire_step > 1:
-            if st.button("السابق", key="back_button"):
-                st.session_state.questionnaire_step -= 1
-                st.rerun()
+            st.button("السابق", key="back_button", on_click=previous_question)
     
     # When all questions have been answered
     else:
         # Display summary of responses
         st.markdown("<h3>ملخص إجاباتك:</h3>", unsafe_allow_html=True)
         
-        questions_dict = PM_GUIDED_QUESTIONS if st.session_state.project_type == "pm" else GP_GUIDED_QUESTIONS
         for field in st.session_state.questionnaire_responses:
-            st.markdown(f"<p><strong>{questions_dict.get(field, field)}</strong> {st.session_state.questionnaire_responses.get(field, '')}</p>", unsafe_allow_html=True)
+            st.markdown(f"<p><strong>{questions.get(field, field)}</strong> {st.session_state.questionnaire_responses.get(field, '')}</p>", unsafe_allow_html=True)
         
         # Generate advice button
         button_text = "توليد النصائح والإرشادات" 
-        if st.button(button_text, key="generate_advice"):
+        if st.button(button_text, key="generate_advice", on_click=record_action):
             with st.spinner("جاري التوليد..."):
-                response = process_guided_questionnaire(
-                    st.session_state.questionnaire_responses, 
-                    project_type=st.session_state.project_type
+                responses, reply, _ = gate_questionnaire(
+                    st.session_state.questionnaire_responses,
+                    session_id=st.session_state.session_id
                 )
+                if reply is not None:
+                    response = reply
+                else:
+                    set_usage_labels(endpoint="streamlit-guided", tenant="streamlit",
+                                     session=st.session_state.session_id, project_type=st.session_state.project_type)
+                    response = process_guided_questionnaire(
+                        responses, 
+                        project_type=st.session_state.project_type
+                    )
+                    remember_response(st.session_state.session_id, responses, response)
                 
                 # Save to chat history
                 st.session_state.messages.append({
@@ -263,16 +324,13 @@ def run_guided_questionnaire():
                     "content": response
                 })
                 
-                # Switch to direct mode after generating advice
+                # Switch to direct mode after generating advice; this changes
+                # the whole page so it needs a full app rerun
                 st.session_state.chat_mode = "direct"
                 st.rerun()
         
         # Start over button
-        if st.button("بدء الاستبيان من جديد", key="restart"):
-            st.session_state.questionnaire_step = 0
-            st.session_state.questionnaire_responses = {}
-            st.session_state.project_type = None
-            st.rerun()
+        st.button("بدء الاستبيان من جديد", key="restart", on_click=restart_questionnaire)
 
 
 def run_direct_mode():
@@ -285,7 +343,7 @@ def run_direct_mode():
             st.markdown(message["content"])
     
     # User input
-    user_input = st.chat_input("اكتب سؤالك هنا...")
+    user_input = st.chat_input("اكتب سؤالك هنا...", max_chars=MAX_QUESTION_CHARS, on_submit=record_action)
     
     if user_input:
         # Add user message to chat history
@@ -295,37 +353,40 @@ def run_direct_mode():
         with st.chat_message("user"):
             st.markdown(user_input)
         
+        # Format chat history for API
+        chat_history = []
+        if len(st.session_state.messages) > 1:
+            for msg in st.session_state.messages[:-1]:  # Exclude current user message
+                if msg["role"] == "user":
+                    chat_history.append({"role": "user", "content": msg["content"]})
+                else:
+                    chat_history.append({"role": "assistant", "content": msg["content"]})
+        
+        # Answer trivial or invalid input without calling the model
+        reply, _ = gate_input(user_input, session_id=st.session_state.session_id, chat_history=chat_history)
+        if reply is not None:
+            with st.chat_message("assistant"):
+                st.markdown(reply)
+            st.session_state.messages.append({"role": "assistant", "content": reply})
+            return
+        
         # Get and display assistant response
         with st.chat_message("assistant"):
             with st.spinner("جاري التفكير..."):
-                # Format chat history for API
-                chat_history = []
-                if len(st.session_state.messages) > 1:
-                    for msg in st.session_state.messages[:-1]:  # Exclude current user message
-                        if msg["role"] == "user":
-                            chat_history.append({"role": "user", "content": msg["content"]})
-                        else:
-                            chat_history.append({"role": "assistant", "content": msg["content"]})
-                
                 # Determine project type based on question content if not set already
                 if not st.session_state.project_type:
-                    # Simple keyword detection
-                    pm_keywords = ["إدارة المشروع", "مدير المشروع", "الجدول الزمني", "المخاطر", "الميزانية", "فريق العمل", "أصحاب المصلحة"]
-                    gp_keywords = ["مشروع التخرج", "مشاريع التخرج", "أفكار", "فكرة مشروع", "تخرجي", "دراستي"]
-                    
-                    pm_count = sum(1 for kw in pm_keywords if kw in user_input)
-                    gp_count = sum(1 for kw in gp_keywords if kw in user_input)
-                    
-                    # Set project type based on keyword count, defaulting to both if unclear
-                    project_type = "pm" if pm_count > gp_count else "gp" if gp_count > pm_count else "pm"  # Default to PM if equal
+                    project_type = detect_project_type(user_input)
                 else:
                     project_type = st.session_state.project_type
                 
+                set_usage_labels(endpoint="streamlit-direct", tenant="streamlit",
+                                 session=st.session_state.session_id, project_type=project_type)
                 response = process_direct_question(
                     user_input, 
                     chat_history=chat_history if chat_history else None, 
                     project_type=project_type
                 )
+                remember_response(st.session_state.session_id, user_input, response, chat_history=chat_history)
                 st.markdown(response)
                 
                 # Add assistant message to chat history
@@ -340,50 +401,20 @@ def display_sidebar():
         # Project area selection
         st.markdown("### تغيير مجال المساعدة")
         
-        if st.button("إدارة المشاريع البرمجية", key="switch_to_pm", use_container_width=True):
-            st.session_state.project_type = "pm"
-            if st.session_state.chat_mode == "guided":
-                st.session_state.questionnaire_step = 1  # Skip the initial project selection
-                st.session_state.questionnaire_responses = {}
-            st.rerun()
-            
-        if st.button("مشاريع التخرج", key="switch_to_gp", use_container_width=True):
-            st.session_state.project_type = "gp"
-            if st.session_state.chat_mode == "guided":
-                st.session_state.questionnaire_step = 1  # Skip the initial project selection
-                st.session_state.questionnaire_responses = {}
-            st.rerun()
+        st.button("إدارة المشاريع البرمجية", key="switch_to_pm", use_container_width=True,
+                  on_click=select_project_type, args=("pm",))
+        st.button("مشاريع التخرج", key="switch_to_gp", use_container_width=True,
+                  on_click=select_project_type, args=("gp",))
         
         # Mode switching
         st.markdown("### تغيير طريقة التفاعل")
         
-        if st.button("الاستبيان الموجه", key="switch_to_guided", use_container_width=True):
-            st.session_state.chat_mode = "guided"
-            # Only reset questionnaire if no project type selected
-            if st.session_state.project_type:
-                st.session_state.questionnaire_step = 1
-            else:
-                st.session_state.questionnaire_step = 0
-            st.session_state.questionnaire_responses = {}
-            st.rerun()
-            
-        if st.button("الطريقة المباشرة", key="switch_to_direct", use_container_width=True):
-            st.session_state.chat_mode = "direct"
-            if not st.session_state.messages:
-                welcome_msg = "مرحباً بك في نمط الطريقة المباشرة. يمكنك الآن طرح سؤالك مباشرة حول إدارة المشاريع البرمجية أو مشاريع التخرج، وسأقوم بمساعدتك."
-                st.session_state.messages.append({"role": "assistant", "content": welcome_msg})
-            st.rerun()
+        st.button("الاستبيان الموجه", key="switch_to_guided", use_container_width=True, on_click=start_guided_mode)
+        st.button("الطريقة المباشرة", key="switch_to_direct", use_container_width=True, on_click=start_direct_mode)
             
         # Clear chat button
         st.markdown("### إعادة تعيين المحادثة")
-        if st.button("مسح المحادثة", key="clear_chat", use_container_width=True):
-            st.session_state.messages = []
-            st.session_state.questionnaire_responses = {}
-            st.session_state.questionnaire_step = 0
-            st.session_state.welcome_shown = False
-            st.session_state.chat_mode = None
-            st.session_state.project_type = None
-            st.rerun()
+        st.button("مسح المحادثة", key="clear_chat", use_container_width=True, on_click=clear_chat)
             
         # Topics based on current context
         st.markdown("---")
@@ -401,16 +432,8 @@ def display_sidebar():
             
         # Display mixed topics
         for topic_type, topic in combined_topics:
-            if st.button(topic, key=f"topic_{topic}", use_container_width=True):
-                st.session_state.chat_mode = "direct"
-                if topic_type == "pm":
-                    query = f"أخبرني المزيد عن {topic}"
-                else:
-                    query = f"اقترح علي أفكار لمشاريع تخرج في مجال {topic}"
-                
-                st.session_state.project_type = topic_type
-                st.session_state.messages.append({"role": "user", "content": query})
-                st.rerun()
+            st.button(topic, key=f"topic_{topic}", use_container_width=True,
+                      on_click=ask_topic, args=(topic_type, topic))
         
         # About section
         st.markdown("---")
@@ -422,6 +445,22 @@ def display_sidebar():
         يعتمد على نموذج Google Gemini للذكاء الاصطناعي.
         </div>
         """, unsafe_allow_html=True)
+        
+        # The questionnaire fragment shows the counters itself
+        if st.session_state.chat_mode != "guided":
+            display_run_stats()
+
+
+def display_run_stats():
+    """Display script executions per user action, to check how much each click costs"""
+    stats = st.session_state.run_stats
+    actions = max(stats["actions"], 1)
+    with st.expander("إحصائيات التنفيذ"):
+        st.caption(
+            f"الإجراءات: {stats['actions']} | التشغيل الكامل: {stats['script_runs']} "
+            f"({stats['script_runs'] / actions:.2f} لكل إجراء) | "
+            f"تشغيل الأجزاء: {stats['fragment_runs']} ({stats['fragment_runs'] / actions:.2f} لكل إجراء)"
+        )
 
 
 # Main app flow
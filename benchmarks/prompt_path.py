@@ -0,0 +1,196 @@
+"""
+Micro-benchmarks for the CPU-side prompt path, with stored baselines.
+
+Covers chat history formatting (build_full_prompt), guided prompt assembly
+(build_guided_prompt), project type keyword detection (detect_project_type)
+and parsing DirectQuestionRequest bodies with long chat histories. Fixtures
+are generated Arabic conversations of 10 to 500 turns with short or long
+messages, so runs are repeatable without network access or API keys.
+
+    python benchmarks/prompt_path.py run                 # print timings
+    python benchmarks/prompt_path.py run --save          # store them as the baseline
+    python benchmarks/prompt_path.py compare             # exit 1 on a regression
+
+Baselines are only comparable on the machine they were recorded on; record a
+new one with `run --save` after changing hardware or Python version.
+"""
+import os
+import sys
+import json
+import time
+import timeit
+import platform
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+
+import utils
+from pydantic import ValidationError
+from api import DirectQuestionRequest
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines.json")
+TURNS = (10, 50, 200, 500)
+
+SHORT_QUESTION = "كيف أتعامل مع تأخر أحد أعضاء الفريق في تسليم المهام؟"
+SHORT_ANSWER = "ابدأ بحوار مباشر لفهم سبب التأخر، ثم أعد توزيع المهام وحدد مواعيد مراجعة أسبوعية."
+LONG_QUESTION = (
+    "أعمل على مشروع تخرج في علوم الحاسوب حول نظام لإدارة المكتبات الجامعية، ولدينا فريق من أربعة طلاب "
+    "وميزانية محدودة وجدول زمني مدته ستة أشهر. ما هي أفضل طريقة لتقسيم العمل وإدارة المخاطر؟ "
+) * 4
+LONG_ANSWER = (
+    "1. قسّم المشروع إلى مراحل واضحة: التحليل، التصميم، التطوير، الاختبار والتوثيق.\n"
+    "2. حدد مسؤولاً لكل مرحلة مع مراجعة أسبوعية للتقدم وتحديث الجدول الزمني.\n"
+    "3. أنشئ سجلاً للمخاطر يتضمن الاحتمال والأثر وخطة الاستجابة لكل خطر.\n"
+    "4. استخدم أدوات مجانية مثل Trello وGitHub لمتابعة المهام والكود.\n"
+) * 6
+
+GUIDED_RESPONSES = {
+    f"question_{i}": "نعمل بأسلوب أجايل مع اجتماعات يومية قصيرة ونواجه صعوبة في تقدير المدة الزمنية للمهام. " * 3
+    for i in range(utils.MAX_ANSWERS)
+}
+
+
+def make_chat(turns, long=False):
+    """Build a chat history of `turns` question/answer pairs"""
+    question, answer = (LONG_QUESTION, LONG_ANSWER) if long else (SHORT_QUESTION, SHORT_ANSWER)
+    history = []
+    for i in range(turns):
+        history.append({"role": "user", "content": f"{question} ({i})"})
+        history.append({"role": "assistant", "content": answer})
+    return history
+
+
+def _request_body(history):
+    return json.dumps({"question": SHORT_QUESTION, "project_type": "pm", "chat_history": history}, ensure_ascii=False)
+
+
+def _rejected(raw):
+    try:
+        DirectQuestionRequest.model_validate(json.loads(raw))
+    except ValidationError:
+        return
+    raise AssertionError("Over-limit request body was accepted")
+
+
+def build_cases():
+    """Return the benchmarks as {name: zero-argument callable}"""
+    cases = {}
+    for turns in TURNS:
+        for size in ("short", "long"):
+            history = make_chat(turns, long=size == "long")
+            cases[f"build_full_prompt[{size}-{turns}]"] = (
+                lambda history=history: utils.build_full_prompt(SHORT_QUESTION, chat_history=history)
+            )
+
+    for project_type in ("pm", "gp"):
+        cases[f"build_guided_prompt[{project_type}]"] = (
+            lambda project_type=project_type: utils.build_guided_prompt(GUIDED_RESPONSES, project_type)
+        )
+
+    for size, question in (("short", SHORT_QUESTION), ("long", LONG_QUESTION[:utils.MAX_QUESTION_CHARS])):
+        cases[f"detect_project_type[{size}]"] = lambda question=question: utils.detect_project_type(question)
+
+    # Bodies within MAX_HISTORY_MESSAGES are parsed. The 500-turn body is over the
+    # limit and measures what decoding and rejecting such a request costs.
+    for turns in TURNS:
+        if 2 * turns > utils.MAX_HISTORY_MESSAGES:
+            continue
+        for size in ("short", "long"):
+            raw = _request_body(make_chat(turns, long=size == "long"))
+            cases[f"parse_request[{size}-{turns}]"] = (
+                lambda raw=raw: DirectQuestionRequest.model_validate(json.loads(raw))
+            )
+    raw = _request_body(make_chat(TURNS[-1], long=True))
+    cases[f"parse_request_rejected[long-{TURNS[-1]}]"] = lambda raw=raw: _rejected(raw)
+    return cases
+
+
+def measure(fn, repeat=5, min_time=0.2):
+    """Return the best seconds per call over `repeat` timing runs"""
+    timer = timeit.Timer(fn)
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / elapsed)) if elapsed else number
+    return min(timer.repeat(repeat=repeat, number=number)) / number
+
+
+def run_benchmarks(pattern=None, repeat=5):
+    results = {}
+    for name, fn in build_cases().items():
+        if pattern and pattern not in name:
+            continue
+        results[name] = measure(fn, repeat=repeat)
+        print(f"{name:<36}{results[name] * 1e6:>12.1f} us", file=sys.stderr)
+    return results
+
+
+def load_baseline(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_baseline(path, results):
+    baseline = {
+        "recorded_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": results,
+    }
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write("\n")
+
+
+def compare(results, baseline, threshold):
+    """
+    Compare results with a baseline
+
+    Returns:
+        list: (name, baseline seconds, current seconds) for each regression
+    """
+    regressions = []
+    print(f"{'benchmark':<36}{'baseline us':>14}{'current us':>14}{'change':>10}")
+    for name, seconds in results.items():
+        base = baseline["results"].get(name)
+        if base is None:
+            print(f"{name:<36}{'-':>14}{seconds * 1e6:>14.1f}{'new':>10}")
+            continue
+        change = seconds / base - 1
+        flag = "  REGRESSION" if change > threshold else ""
+        print(f"{name:<36}{base * 1e6:>14.1f}{seconds * 1e6:>14.1f}{change:>+10.1%}{flag}")
+        if change > threshold:
+            regressions.append((name, base, seconds))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Prompt path micro-benchmarks.")
+    parser.add_argument("command", choices=["run", "compare"])
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="Baseline file (default: benchmarks/baselines.json)")
+    parser.add_argument("--save", action="store_true", help="With run: store the results as the baseline")
+    parser.add_argument("--threshold", type=float, default=0.25,
+                        help="With compare: allowed slowdown before failing, as a fraction (default: 0.25)")
+    parser.add_argument("--filter", help="Only run benchmarks whose name contains this text")
+    parser.add_argument("--repeat", type=int, default=5, help="Timing runs per benchmark, best is kept (default: 5)")
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.filter, args.repeat)
+
+    if args.command == "run":
+        if args.save:
+            save_baseline(args.baseline, results)
+            print(f"Saved {len(results)} results to {args.baseline}", file=sys.stderr)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}, record one with `run --save`", file=sys.stderr)
+        return 2
+    regressions = compare(results, load_baseline(args.baseline), args.threshold)
+    if regressions:
+        print(f"{len(regressions)} benchmark(s) regressed by more than {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""
+Compare messages per second of the REST chat path (/api/direct-question) with
+the WebSocket path (/ws/chat).
+
+The model is replaced by an instant stand-in so the numbers reflect transport,
+parsing and history handling overhead only. Both paths go through the same
+gate, scheduler and prompt building code.
+
+    python benchmarks/ws_vs_rest.py --messages 200
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import argparse
+import threading
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("GEMINI_API_KEY", "benchmark")
+os.environ.setdefault("WS_MAX_MESSAGES_PER_MINUTE", "1000000")
+
+import requests
+import uvicorn
+from websockets.sync.client import connect
+
+import utils
+import api
+
+REPLY = "هذه إجابة تجريبية قصيرة تحاكي رد المساعد حول إدارة المشروع. " * 8
+
+
+class _Chunk:
+    def __init__(self, text):
+        self.text = text
+
+
+class InstantModel:
+    """Stand-in for genai.GenerativeModel that answers immediately"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def generate_content(self, prompt, stream=False, request_options=None):
+        if stream:
+            return (_Chunk(REPLY[i:i + 40]) for i in range(0, len(REPLY), 40))
+        return _Chunk(REPLY)
+
+
+def question(i):
+    return f"ما هي أفضل طريقة لإدارة المخاطر في المرحلة رقم {i} من المشروع؟"
+
+
+def run_rest(base_url, count):
+    history = []
+    session = requests.Session()
+    headers = {"X-Session-ID": uuid.uuid4().hex}
+    started = time.perf_counter()
+    for i in range(count):
+        body = {"question": question(i), "project_type": "pm", "chat_history": history[-utils.MAX_HISTORY_MESSAGES:]}
+        reply = session.post(f"{base_url}/api/direct-question", json=body, headers=headers)
+        reply.raise_for_status()
+        history += [{"role": "user", "content": question(i)},
+                    {"role": "assistant", "content": reply.json()["response"]}]
+    return time.perf_counter() - started
+
+
+def run_ws(ws_url, count):
+    started = time.perf_counter()
+    with connect(f"{ws_url}/ws/chat?project_type=pm", max_size=None) as ws:
+        for i in range(count):
+            ws.send(json.dumps({"type": "message", "content": question(i)}))
+            while True:
+                event = json.loads(ws.recv())
+                if event["type"] in ("end", "cancelled", "error"):
+                    break
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=200, help="Messages per conversation")
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    utils.genai.GenerativeModel = InstantModel
+    server = uvicorn.Server(uvicorn.Config(api.app, host="127.0.0.1", port=args.port, log_level="warning"))
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+
+    rest_seconds = run_rest(f"http://127.0.0.1:{args.port}", args.messages)
+    ws_seconds = run_ws(f"ws://127.0.0.1:{args.port}", args.messages)
+    server.should_exit = True
+
+    print(f"{'path':<10}{'messages':>10}{'seconds':>10}{'msg/s':>10}")
+    for name, seconds in (("rest", rest_seconds), ("websocket", ws_seconds)):
+        print(f"{name:<10}{args.messages:>10}{seconds:>10.2f}{args.messages / seconds:>10.1f}")
+    print(f"websocket speedup: {rest_seconds / ws_seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
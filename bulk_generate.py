@@ -0,0 +1,220 @@
+"""
+Generate guided-questionnaire reports for many students at once.
+
+Reads questionnaire answers from a CSV or JSONL file (one student per row),
+runs process_guided_questionnaire concurrently in a process pool and appends
+one JSON line per row to the output file. The output file doubles as the
+checkpoint: rerunning the same command skips rows already written, so a
+crashed run resumes where it stopped. Rows that failed are retried.
+
+    python bulk_generate.py answers.csv results.jsonl --workers 4 --rate 60
+"""
+import os
+import sys
+import csv
+import json
+import time
+import argparse
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+
+
+def read_rows(path, input_format):
+    """
+    Stream rows from a CSV or JSONL file
+
+    Args:
+        path (str): Input file path
+        input_format (str): "csv" or "jsonl"
+
+    Yields:
+        dict: One row of questionnaire answers
+    """
+    with open(path, encoding="utf-8-sig", newline="") as f:
+        if input_format == "csv":
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+
+
+def load_completed(output_path):
+    """Return the ids already written to the output file, except failed ones"""
+    completed = set()
+    if not os.path.exists(output_path):
+        return completed
+    with open(output_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                # A line cut short by a crash; the row is regenerated
+                continue
+            if record.get("status") in ("ok", "skipped"):
+                completed.add(str(record["id"]))
+    return completed
+
+
+def truncate_partial_line(output_path):
+    """
+    Cut a line left unfinished by a crash off the end of the output file, so
+    records appended on resume start on a line of their own. A complete record
+    that only lacks its newline is kept and the newline is added.
+    """
+    if not os.path.exists(output_path):
+        return
+    with open(output_path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            step = min(4096, position)
+            f.seek(position - step)
+            newline = f.read(step).rfind(b"\n")
+            if newline != -1:
+                position = position - step + newline + 1
+                break
+            position -= step
+        if position == end:
+            return
+        f.seek(position)
+        try:
+            json.loads(f.read())
+        except ValueError:
+            f.truncate(position)
+        else:
+            f.write(b"\n")
+
+
+class RateLimiter:
+    """Token bucket limiting how many generations start per minute"""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute else 0.0
+        self.next_start = time.monotonic()
+
+    def wait(self):
+        if not self.interval:
+            return
+        now = time.monotonic()
+        if self.next_start > now:
+            time.sleep(self.next_start - now)
+        self.next_start = max(now, self.next_start) + self.interval
+
+
+def _init_worker():
+    # Each worker process configures the Gemini client once
+    from utils import setup_openai
+    setup_openai()
+
+
+def _generate(row_id, responses, project_type):
+    from utils import process_guided_questionnaire, gate_questionnaire
+    from prompts import MODEL_ERROR_RESPONSE
+    from usage import usage_meter, set_usage_labels
+
+    started = time.monotonic()
+    answered, reply, reason = gate_questionnaire(responses)
+    if reply is not None:
+        return {"id": row_id, "project_type": project_type, "status": "skipped",
+                "reason": reason, "response": None, "seconds": 0.0}
+
+    set_usage_labels(endpoint="bulk", tenant="bulk", session=row_id, project_type=project_type)
+    response = process_guided_questionnaire(answered, project_type=project_type)
+    # Worker processes exit without running atexit handlers, so flush per row
+    usage_meter.flush()
+    status = "error" if response == MODEL_ERROR_RESPONSE else "ok"
+    return {"id": row_id, "project_type": project_type, "status": status,
+            "response": response if status == "ok" else None,
+            "seconds": round(time.monotonic() - started, 3)}
+
+
+def _format_seconds(seconds):
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}"
+
+
+def run(args):
+    input_format = args.format or ("jsonl" if args.input.endswith((".jsonl", ".json")) else "csv")
+    truncate_partial_line(args.output)
+    completed = load_completed(args.output)
+    total = sum(1 for _ in read_rows(args.input, input_format))
+    remaining = total - len(completed)
+    print(f"{total} rows, {len(completed)} already done, {remaining} to generate", file=sys.stderr)
+
+    limiter = RateLimiter(args.rate)
+    excluded = {args.id_column, args.project_type_column}
+    counts = {"ok": 0, "error": 0, "skipped": 0}
+    started = time.monotonic()
+
+    with open(args.output, "a", encoding="utf-8") as out, \
+            ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker) as pool:
+        pending = set()
+
+        def drain(block):
+            done, _ = wait(pending, timeout=None if block else 0, return_when=FIRST_COMPLETED)
+            for future in done:
+                pending.discard(future)
+                record = future.result()
+                out.write(json.dumps(record, ensure_ascii=False) + "\n")
+                out.flush()
+                counts[record["status"]] += 1
+
+                finished = sum(counts.values())
+                elapsed = time.monotonic() - started
+                rate = finished / elapsed if elapsed else 0.0
+                eta = (remaining - finished) / rate if rate else 0.0
+                print(
+                    f"\r{finished}/{remaining} done ({counts['error']} errors, {counts['skipped']} skipped) "
+                    f"{rate * 60:.1f} rows/min, ETA {_format_seconds(eta)}",
+                    end="", file=sys.stderr, flush=True
+                )
+
+        for index, row in enumerate(read_rows(args.input, input_format)):
+            row_id = str(row.get(args.id_column) or index)
+            if row_id in completed:
+                continue
+            project_type = row.get(args.project_type_column) or args.project_type
+            responses = {
+                key: str(value) for key, value in row.items()
+                if key not in excluded and value not in (None, "")
+            }
+
+            # Keep a bounded number of rows in flight so large inputs stay streaming
+            while len(pending) >= args.workers * 2:
+                drain(block=True)
+            limiter.wait()
+            pending.add(pool.submit(_generate, row_id, responses, project_type))
+            drain(block=False)
+
+        while pending:
+            drain(block=True)
+
+    elapsed = time.monotonic() - started
+    print(
+        f"\nFinished in {_format_seconds(elapsed)}: {counts['ok']} ok, "
+        f"{counts['error']} errors, {counts['skipped']} skipped",
+        file=sys.stderr
+    )
+    return 0 if counts["error"] == 0 else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-generate guided questionnaire reports.")
+    parser.add_argument("input", help="CSV or JSONL file with one row of answers per student")
+    parser.add_argument("output", help="JSONL file results are appended to; also used to resume")
+    parser.add_argument("--format", choices=["csv", "jsonl"], help="Input format (default: from extension)")
+    parser.add_argument("--id-column", default="id", help="Column identifying the row (default: id)")
+    parser.add_argument("--project-type", choices=["pm", "gp"], default="gp",
+                        help="Questionnaire type used when a row does not set one (default: gp)")
+    parser.add_argument("--project-type-column", default="questionnaire_type",
+                        help="Column holding a per-row questionnaire type (default: questionnaire_type)")
+    parser.add_argument("--workers", type=int, default=4, help="Worker processes (default: 4)")
+    parser.add_argument("--rate", type=float, default=60,
+                        help="Maximum generations started per minute, 0 for no limit (default: 60)")
+    return run(parser.parse_args(argv))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
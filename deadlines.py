@@ -0,0 +1,67 @@
+import os
+import time
+import threading
+
+# Deadline applied when the client does not send one
+DEFAULT_DEADLINE_SECONDS = float(os.getenv("REQUEST_DEADLINE_SECONDS", "60"))
+MAX_DEADLINE_SECONDS = float(os.getenv("MAX_REQUEST_DEADLINE_SECONDS", "300"))
+
+# Budget assumed for a fresh generation before any latency has been observed
+MIN_GENERATION_SECONDS = float(os.getenv("MIN_GENERATION_SECONDS", "2"))
+
+
+class DeadlineExceeded(Exception):
+    """Raised when a request's deadline passed or its client went away"""
+
+
+class Deadline:
+    """
+    End-to-end deadline of a request, carried from the API handler through the
+    scheduler queue down to the model call. Cancelling it (e.g. when the client
+    disconnects) makes every stage stop as if the deadline had passed.
+    """
+
+    def __init__(self, seconds=None):
+        seconds = DEFAULT_DEADLINE_SECONDS if seconds is None else seconds
+        self.expires_at = time.monotonic() + min(seconds, MAX_DEADLINE_SECONDS)
+        self._cancelled = threading.Event()
+
+    @classmethod
+    def from_header(cls, value):
+        """
+        Build a deadline from a client-supplied timeout header in seconds
+
+        Args:
+            value (str, optional): Header value, ignored if missing or invalid
+
+        Returns:
+            Deadline: The request deadline
+        """
+        try:
+            seconds = float(value)
+        except (TypeError, ValueError):
+            return cls()
+        return cls(seconds) if seconds > 0 else cls()
+
+    def remaining(self):
+        """Seconds left, 0 once expired or cancelled"""
+        if self._cancelled.is_set():
+            return 0.0
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self):
+        return self.remaining() <= 0
+
+    def cancel(self):
+        self._cancelled.set()
+
+    @property
+    def cancelled(self):
+        return self._cancelled.is_set()
+
+    def check(self):
+        """Raise DeadlineExceeded if the deadline passed or was cancelled"""
+        if self.cancelled:
+            raise DeadlineExceeded("Request was cancelled")
+        if self.expired():
+            raise DeadlineExceeded("Request deadline exceeded")
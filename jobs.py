@@ -0,0 +1,171 @@
+import os
+import time
+import uuid
+import socket
+import ipaddress
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlparse
+import requests
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class JobQueueFullError(Exception):
+    """Raised when a job cannot be queued because too many jobs are waiting"""
+
+
+def validate_callback_url(url):
+    """
+    Check that a webhook URL is safe for the server to POST to
+
+    Only http(s) URLs are accepted. When JOB_CALLBACK_ALLOWED_HOSTS is set
+    (comma-separated), the host must be one of them; otherwise every address
+    the host resolves to must be public, so callbacks cannot reach loopback,
+    private or link-local services.
+
+    Raises:
+        ValueError: If the URL is not allowed
+    """
+    parsed = urlparse(url)
+    if parsed.scheme not in ("http", "https") or not parsed.hostname:
+        raise ValueError("callback_url must be an http or https URL")
+
+    allowed = {h.strip().lower() for h in os.getenv("JOB_CALLBACK_ALLOWED_HOSTS", "").split(",") if h.strip()}
+    if allowed:
+        if parsed.hostname.lower() not in allowed:
+            raise ValueError("callback_url host is not allowed")
+        return
+
+    try:
+        addresses = {info[4][0] for info in socket.getaddrinfo(parsed.hostname, parsed.port or 443)}
+    except (socket.gaierror, UnicodeError):
+        raise ValueError("callback_url host cannot be resolved")
+    for address in addresses:
+        if not ipaddress.ip_address(address.split("%", 1)[0]).is_global:
+            raise ValueError("callback_url must not point to a private or local address")
+
+
+class JobManager:
+    """
+    Runs long generations in a background worker pool and keeps their results
+    for `retention_seconds` after they finish.
+
+    Finished jobs are optionally reported to a webhook URL with a POST request
+    carrying the same JSON body as the status endpoint.
+    """
+
+    def __init__(self, max_workers=None, retention_seconds=None, callback_timeout=10, max_queued=None):
+        self.max_workers = max_workers or int(os.getenv("JOB_WORKERS", "4"))
+        self.max_queued = max_queued or int(os.getenv("JOB_MAX_QUEUE", "100"))
+        self.retention_seconds = retention_seconds or int(os.getenv("JOB_RETENTION_SECONDS", "3600"))
+        self.callback_timeout = callback_timeout
+        self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="job")
+        self._jobs = {}
+        self._lock = threading.Lock()
+
+    def submit(self, fn, callback_url=None, **kwargs):
+        """
+        Start a job in the background
+
+        Args:
+            fn (callable): The function producing the job result
+            callback_url (str, optional): Webhook notified when the job finishes
+            **kwargs: Arguments passed to fn
+
+        Returns:
+            dict: The job status
+
+        Raises:
+            ValueError: If callback_url is not allowed, see validate_callback_url
+            JobQueueFullError: If max_queued jobs are already waiting
+        """
+        if callback_url:
+            validate_callback_url(callback_url)
+        self.purge_expired()
+        job_id = uuid.uuid4().hex
+        job = {
+            "job_id": job_id,
+            "status": QUEUED,
+            "result": None,
+            "error": None,
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "callback_url": callback_url,
+            "callback_status": None,
+        }
+        with self._lock:
+            if sum(1 for j in self._jobs.values() if j["status"] == QUEUED) >= self.max_queued:
+                raise JobQueueFullError("Job queue is full")
+            self._jobs[job_id] = job
+        # Run the job in the submitter's context so context variables follow it
+        self._executor.submit(contextvars.copy_context().run, self._run, job_id, fn, kwargs)
+        return self.get(job_id)
+
+    def get(self, job_id):
+        """Return a copy of the job status, or None if unknown or expired"""
+        self.purge_expired()
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def purge_expired(self):
+        """Drop finished jobs older than the retention period"""
+        cutoff = time.time() - self.retention_seconds
+        with self._lock:
+            expired = [
+                job_id for job_id, job in self._jobs.items()
+                if job["finished_at"] is not None and job["finished_at"] < cutoff
+            ]
+            for job_id in expired:
+                del self._jobs[job_id]
+        return len(expired)
+
+    def stats(self):
+        with self._lock:
+            counts = {QUEUED: 0, RUNNING: 0, SUCCEEDED: 0, FAILED: 0}
+            for job in self._jobs.values():
+                counts[job["status"]] += 1
+        return {"workers": self.max_workers, "max_queued": self.max_queued,
+                "retention_seconds": self.retention_seconds, "jobs": counts}
+
+    def _update(self, job_id, **fields):
+        with self._lock:
+            self._jobs[job_id].update(fields)
+
+    def _run(self, job_id, fn, kwargs):
+        self._update(job_id, status=RUNNING, started_at=time.time())
+        try:
+            result = fn(**kwargs)
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e), finished_at=time.time())
+        else:
+            self._update(job_id, status=SUCCEEDED, result=result, finished_at=time.time())
+
+        job = self.get(job_id)
+        if job and job["callback_url"]:
+            self._notify(job)
+
+    def _notify(self, job):
+        payload = {k: v for k, v in job.items() if k not in ("callback_url", "callback_status")}
+        try:
+            # Checked again since DNS may have changed since submission; redirects
+            # are not followed so they cannot lead to an internal address
+            validate_callback_url(job["callback_url"])
+            reply = requests.post(job["callback_url"], json=payload, timeout=self.callback_timeout,
+                                  allow_redirects=False)
+            callback_status = reply.status_code
+        except ValueError as e:
+            callback_status = f"rejected: {e}"
+        except requests.RequestException as e:
+            callback_status = f"error: {e}"
+        self._update(job["job_id"], callback_status=callback_status)
+
+
+job_manager = JobManager()
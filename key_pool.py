@@ -0,0 +1,314 @@
+import os
+import time
+import threading
+from collections import deque
+from contextlib import contextmanager
+
+# Cooldowns applied to a key after upstream errors, in seconds
+RATE_LIMIT_COOLDOWN = float(os.getenv("KEY_RATE_LIMIT_COOLDOWN", "60"))
+AUTH_ERROR_COOLDOWN = float(os.getenv("KEY_AUTH_ERROR_COOLDOWN", "3600"))
+MAX_RATE_LIMIT_COOLDOWN = 600
+
+# Exception names and status codes used by google.api_core for these errors
+_RATE_LIMIT_ERRORS = {"ResourceExhausted", "TooManyRequests"}
+_AUTH_ERRORS = {"PermissionDenied", "Unauthenticated", "Unauthorized", "Forbidden"}
+
+
+class NoKeyAvailableError(Exception):
+    """
+    Raised when the pool has no keys, or when every key of a pool with several
+    keys is cooling down; `retry_after` is then the seconds until one recovers
+    """
+
+    def __init__(self, message, retry_after=None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def load_api_keys():
+    """
+    Load Gemini API keys from the environment
+
+    Keys are read from GEMINI_API_KEYS (comma-separated), then from the file in
+    GEMINI_API_KEYS_FILE (one key per line, # for comments), and finally from
+    the single GEMINI_API_KEY.
+
+    Returns:
+        list: The API keys, without duplicates
+    """
+    keys = [k.strip() for k in os.getenv("GEMINI_API_KEYS", "").split(",")]
+    keys_file = os.getenv("GEMINI_API_KEYS_FILE")
+    if keys_file and os.path.exists(keys_file):
+        with open(keys_file, encoding="utf-8") as f:
+            keys += [line.split("#", 1)[0].strip() for line in f]
+    keys.append((os.getenv("GEMINI_API_KEY") or "").strip())
+    return list(dict.fromkeys(k for k in keys if k))
+
+
+def classify_error(exc):
+    """
+    Classify an upstream error for key cooldown purposes
+
+    Returns:
+        str: "rate_limit", "auth" or "other"
+    """
+    name = type(exc).__name__
+    code = getattr(exc, "code", None)
+    message = str(exc).lower()
+    if name in _RATE_LIMIT_ERRORS or code == 429 or "quota" in message or "rate limit" in message:
+        return "rate_limit"
+    if name in _AUTH_ERRORS or code in (401, 403) or "api key not valid" in message:
+        return "auth"
+    return "other"
+
+
+def mask_key(key):
+    """Show only the last characters of a key in metrics and logs"""
+    return f"...{key[-4:]}" if len(key) > 4 else "..."
+
+
+class _KeyState:
+    def __init__(self, key):
+        self.key = key
+        self.in_flight = 0
+        self.requests = 0
+        self.tokens = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.auth_errors = 0
+        self.consecutive_rate_limits = 0
+        self.cooldown_until = 0.0
+        # Calls made while every key was cooling down
+        self.forced = 0
+        # Request timestamps and (timestamp, tokens) of the last minute
+        self.recent_requests = deque()
+        self.recent_tokens = deque()
+
+    def load(self, now):
+        while self.recent_requests and now - self.recent_requests[0] > 60:
+            self.recent_requests.popleft()
+        while self.recent_tokens and now - self.recent_tokens[0][0] > 60:
+            self.recent_tokens.popleft()
+        return self.in_flight, len(self.recent_requests), sum(tokens for _, tokens in self.recent_tokens)
+
+
+class KeyLease:
+    """A key handed out by the pool for one upstream call"""
+
+    def __init__(self, key):
+        self.key = key
+        self.tokens = 0
+        self.released = False
+
+    def record_tokens(self, tokens):
+        self.tokens += tokens or 0
+
+
+class KeyPool:
+    """
+    Spreads upstream calls over several API keys.
+
+    Each call takes the least-loaded key (fewest calls in flight, then fewest
+    requests and tokens in the last minute) that is not cooling down. Keys that
+    hit a rate limit cool down for RATE_LIMIT_COOLDOWN seconds, doubling on
+    consecutive limits; keys rejected for authentication cool down for
+    AUTH_ERROR_COOLDOWN seconds.
+
+    When every key is cooling down, a pool with several keys raises
+    NoKeyAvailableError with the time until the first key recovers, rather
+    than spending calls on keys known to be exhausted. A single key is used
+    anyway, so a transient 429 on a one-key deployment does not turn into an
+    outage.
+    """
+
+    def __init__(self, keys=None):
+        self._lock = threading.Lock()
+        self._keys = {}
+        self.load(keys or [])
+
+    def load(self, keys):
+        """Set the keys of the pool, keeping the state of keys already present"""
+        with self._lock:
+            self._keys = {key: self._keys.get(key) or _KeyState(key) for key in keys}
+
+    def __len__(self):
+        return len(self._keys)
+
+    @contextmanager
+    def acquire(self):
+        """
+        Lease a key for one upstream call
+
+        Errors raised inside the block are reported against the key before
+        being re-raised.
+
+        Yields:
+            KeyLease: The leased key; call record_tokens() with the usage
+        """
+        lease = KeyLease(self._take())
+        try:
+            yield lease
+        except Exception as e:
+            self._release(lease, error=e)
+            raise
+        finally:
+            # Also covers GeneratorExit when a streaming caller stops early
+            if not lease.released:
+                self._release(lease)
+
+    def _take(self):
+        now = time.monotonic()
+        with self._lock:
+            if not self._keys:
+                raise NoKeyAvailableError("No API keys configured")
+            available = [state for state in self._keys.values() if state.cooldown_until <= now]
+            if available:
+                state = min(available, key=lambda s: s.load(now))
+            elif len(self._keys) > 1:
+                retry_after = min(state.cooldown_until for state in self._keys.values()) - now
+                raise NoKeyAvailableError("All API keys are cooling down", retry_after=retry_after)
+            else:
+                state = next(iter(self._keys.values()))
+                state.forced += 1
+            state.in_flight += 1
+            state.requests += 1
+            state.recent_requests.append(now)
+            return state.key
+
+    def _release(self, lease, error=None):
+        lease.released = True
+        now = time.monotonic()
+        with self._lock:
+            state = self._keys.get(lease.key)
+            if state is None:
+                return
+            state.in_flight -= 1
+            state.tokens += lease.tokens
+            if lease.tokens:
+                state.recent_tokens.append((now, lease.tokens))
+            if error is None:
+                state.consecutive_rate_limits = 0
+                return
+
+            state.errors += 1
+            kind = classify_error(error)
+            if kind == "rate_limit":
+                state.rate_limited += 1
+                state.consecutive_rate_limits += 1
+                cooldown = RATE_LIMIT_COOLDOWN * 2 ** (state.consecutive_rate_limits - 1)
+                state.cooldown_until = now + min(cooldown, MAX_RATE_LIMIT_COOLDOWN)
+            elif kind == "auth":
+                state.auth_errors += 1
+                state.cooldown_until = now + AUTH_ERROR_COOLDOWN
+
+    def stats(self):
+        """Return per-key request, token and error metrics, with keys masked"""
+        now = time.monotonic()
+        with self._lock:
+            keys = []
+            for state in self._keys.values():
+                in_flight, requests_last_minute, tokens_last_minute = state.load(now)
+                keys.append({
+                    "key": mask_key(state.key),
+                    "in_flight": in_flight,
+                    "requests": state.requests,
+                    "tokens": state.tokens,
+                    "requests_last_minute": requests_last_minute,
+                    "tokens_last_minute": tokens_last_minute,
+                    "errors": state.errors,
+                    "rate_limited": state.rate_limited,
+                    "auth_errors": state.auth_errors,
+                    "cooldown_seconds": max(0.0, state.cooldown_until - now),
+                    "used_while_cooling": state.forced,
+                })
+            return {"keys": keys}
+
+
+class ResourceExhausted(Exception):
+    """Rate limit error raised by SimulatedBackend, named like google.api_core's"""
+    code = 429
+
+
+class PermissionDenied(Exception):
+    """Auth error raised by SimulatedBackend, named like google.api_core's"""
+    code = 403
+
+
+class SimulatedBackend:
+    """
+    Local stand-in for the Gemini API with per-key quotas, used to exercise a
+    KeyPool without network access or real keys.
+
+    Args:
+        requests_per_minute (int): Requests each key may make per minute
+        tokens_per_minute (int): Tokens each key may use per minute
+        invalid_keys (iterable): Keys rejected with PermissionDenied
+        latency (float): Seconds each call takes
+        tokens_per_call (int): Tokens charged for each call
+    """
+
+    def __init__(self, requests_per_minute=15, tokens_per_minute=100000, invalid_keys=(),
+                 latency=0.0, tokens_per_call=500):
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.invalid_keys = set(invalid_keys)
+        self.latency = latency
+        self.tokens_per_call = tokens_per_call
+        self._usage = {}
+        self._lock = threading.Lock()
+
+    def generate(self, key, prompt):
+        """Answer a prompt as `key`, raising the errors the real API would"""
+        if key in self.invalid_keys:
+            raise PermissionDenied("API key not valid")
+        now = time.monotonic()
+        with self._lock:
+            usage = self._usage.setdefault(key, deque())
+            while usage and now - usage[0][0] > 60:
+                usage.popleft()
+            if len(usage) >= self.requests_per_minute:
+                raise ResourceExhausted("Quota exceeded for requests per minute")
+            if sum(tokens for _, tokens in usage) + self.tokens_per_call > self.tokens_per_minute:
+                raise ResourceExhausted("Quota exceeded for tokens per minute")
+            usage.append((now, self.tokens_per_call))
+        if self.latency:
+            time.sleep(self.latency)
+        return f"simulated answer to: {prompt[:20]}", self.tokens_per_call
+
+
+def simulate(pool, backend, requests=100, concurrency=8):
+    """
+    Drive a KeyPool against a SimulatedBackend
+
+    Returns:
+        dict: Counts of successful, rate-limited and rejected calls plus pool stats
+    """
+    from concurrent.futures import ThreadPoolExecutor
+
+    outcomes = {"ok": 0, "rate_limit": 0, "auth": 0, "no_key": 0}
+    outcomes_lock = threading.Lock()
+
+    def call(i):
+        try:
+            with pool.acquire() as lease:
+                _, tokens = backend.generate(lease.key, f"prompt {i}")
+                lease.record_tokens(tokens)
+            outcome = "ok"
+        except NoKeyAvailableError:
+            outcome = "no_key"
+        except Exception as e:
+            outcome = classify_error(e)
+        with outcomes_lock:
+            outcomes[outcome] += 1
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(call, range(requests)))
+    return {"outcomes": outcomes, **pool.stats()}
+
+
+if __name__ == "__main__":
+    import json
+
+    demo_pool = KeyPool(["key-aaaa", "key-bbbb", "key-cccc", "key-bad0"])
+    demo_backend = SimulatedBackend(requests_per_minute=20, invalid_keys={"key-bad0"}, latency=0.01)
+    print(json.dumps(simulate(demo_pool, demo_backend, requests=100), indent=2))
@@ -132,6 +132,47 @@ GP_GUIDED_GENERATION_TEMPLATE = """
 يمكنك الآن طرح أسئلة محددة حول أي من هذه الأفكار أو طلب المزيد من التفاصيل حول جوانب معينة.
 """
 
+# Sections of the guided reports in template order, used to generate each
+# section with its own smaller model call. "fields" lists the answers a section
+# depends on (None for all of them); fewer fields make the section more reusable
+# across users when cached.
+PM_GUIDED_SECTIONS = [
+    {"key": "general_advice", "title": "نصائح عامة",
+     "instruction": "نصائح عامة مخصصة بناءً على إجابات المستخدم", "fields": None},
+    {"key": "suggested_tools", "title": "أدوات مقترحة",
+     "instruction": "أدوات مقترحة بناءً على احتياجات المشروع",
+     "fields": ["project_type", "team_size", "methodology", "tools"]},
+    {"key": "best_practices", "title": "أفضل الممارسات",
+     "instruction": "أفضل الممارسات في إدارة المشاريع البرمجية",
+     "fields": ["experience", "project_phase", "methodology"]},
+    {"key": "actionable_steps", "title": "خطوات عملية",
+     "instruction": "خطوات عملية يمكن تطبيقها فوراً", "fields": None},
+    {"key": "additional_resources", "title": "موارد إضافية",
+     "instruction": "موارد إضافية للمساعدة في إدارة المشروع", "fields": ["experience", "methodology"]},
+]
+
+GP_GUIDED_SECTIONS = [
+    {"key": "project_ideas", "title": "أفكار مشاريع مقترحة",
+     "instruction": "أفكار مشاريع مخصصة بناءً على مجال الدراسة والاهتمامات", "fields": None},
+    {"key": "suggested_technologies", "title": "التقنيات المقترحة",
+     "instruction": "تقنيات مقترحة لتنفيذ المشاريع", "fields": ["field_of_study", "interests", "skills"]},
+    {"key": "starting_steps", "title": "خطوات بدء المشروع",
+     "instruction": "خطوات عملية لبدء تنفيذ المشروع", "fields": ["field_of_study", "team_size", "duration"]},
+    {"key": "challenges_and_solutions", "title": "تحديات محتملة وحلولها",
+     "instruction": "تحديات محتملة وحلولها", "fields": ["field_of_study", "team_size", "duration", "constraints"]},
+    {"key": "learning_resources", "title": "موارد تعليمية مفيدة",
+     "instruction": "موارد تعليمية للمساعدة في تنفيذ المشروع", "fields": ["field_of_study"]},
+]
+
+# Prompt for generating a single section of a guided report
+GUIDED_SECTION_TEMPLATE = """
+اكتب قسماً واحداً فقط من تقرير مخصص للمستخدم بعنوان: {title}
+
+المطلوب في هذا القسم: {instruction}
+
+اكتب محتوى القسم مباشرة في نقاط مختصرة وعملية، بدون عنوان وبدون مقدمة أو خاتمة، ولا تتطرق إلى أقسام التقرير الأخرى.
+"""
+
 # Template for direct mode responses - project management
 PM_DIRECT_MODE_TEMPLATE = """
 سأقوم بالإجابة على سؤالك حول {topic} في إدارة المشاريع البرمجية.
@@ -176,3 +217,39 @@ GUIDED_QUESTIONS = {
     **GP_GUIDED_QUESTIONS
 } 
 
+
+# Reply shown when the model call fails
+MODEL_ERROR_RESPONSE = "عذراً، حدث خطأ في الاتصال بنموذج الذكاء الاصطناعي. يرجى المحاولة مرة أخرى."
+
+# Precomputed reply used when a request's deadline leaves no time for a fresh answer
+BUSY_FALLBACK_RESPONSE = "عذراً، الخدمة مشغولة حالياً ولم يتسع الوقت لإعداد إجابة مفصلة. يرجى إعادة إرسال سؤالك بعد قليل."
+
+# Canned replies returned by the input gate instead of calling the model
+GREETING_RESPONSE = "أهلاً بك! 👋 أنا مساعدك في إدارة المشاريع البرمجية ومشاريع التخرج. كيف يمكنني مساعدتك اليوم؟"
+
+THANKS_RESPONSE = "العفو! يسعدني مساعدتك. هل لديك أي سؤال آخر حول مشروعك؟"
+
+EMPTY_INPUT_RESPONSE = "يرجى كتابة سؤالك أو إجابتك حتى أتمكن من مساعدتك."
+
+TOO_LONG_INPUT_RESPONSE = "النص الذي أرسلته طويل جداً. يرجى اختصاره والتركيز على سؤالك الأساسي."
+
+UNSUPPORTED_LANGUAGE_RESPONSE = "عذراً، يمكنني الرد على الأسئلة المكتوبة باللغة العربية أو الإنجليزية فقط."
+
+SPAM_INPUT_RESPONSE = "عذراً، لم أتمكن من فهم رسالتك. يرجى كتابة سؤال واضح حول مشروعك."
+
+DUPLICATE_PENDING_RESPONSE = "ما زلت أعمل على سؤالك السابق، يرجى الانتظار قليلاً."
+
+# Short messages answered with a canned reply
+GREETING_PHRASES = {
+    "مرحبا", "مرحبا بك", "اهلا", "اهلا وسهلا", "اهلين", "السلام عليكم", "سلام عليكم",
+    "السلام عليكم ورحمه الله", "السلام عليكم ورحمه الله وبركاته", "صباح الخير", "مساء الخير",
+    "hi", "hello", "hey", "salam", "good morning", "good evening"
+}
+
+THANKS_PHRASES = {
+    "شكرا", "شكرا لك", "شكرا جزيلا", "مشكور", "جزاك الله خيرا", "thanks", "thank you", "thx"
+}
+
+# Keywords used to guess the project type of a direct question
+PM_KEYWORDS = ("إدارة المشروع", "مدير المشروع", "الجدول الزمني", "المخاطر", "الميزانية", "فريق العمل", "أصحاب المصلحة")
+GP_KEYWORDS = ("مشروع التخرج", "مشاريع التخرج", "أفكار", "فكرة مشروع", "تخرجي", "دراستي")
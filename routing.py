@@ -0,0 +1,247 @@
+import os
+import json
+import time
+import threading
+from collections import deque
+
+# Request classes used to pick a model and generation config
+SHORT_FOLLOWUP = "short_followup"
+DIRECT_FIRST_TURN = "direct_first_turn"
+GUIDED_PM = "guided_pm"
+GUIDED_GP = "guided_gp"
+GUIDED_SECTION = "guided_section"
+
+# Follow-up questions up to this many characters are treated as short
+SHORT_FOLLOWUP_MAX_CHARS = int(os.getenv("SHORT_FOLLOWUP_MAX_CHARS", "300"))
+
+# Default routing rules per request class. Each rule can be overridden through
+# the MODEL_ROUTES environment variable (JSON) or a JSON file in MODEL_ROUTES_FILE.
+DEFAULT_ROUTES = {
+    SHORT_FOLLOWUP: {
+        "model": "gemini-2.0-flash",
+        "fallback_model": "gemini-2.0-flash-lite",
+        "latency_slo": 4.0,
+        "generation_config": {
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 1024,
+        },
+    },
+    DIRECT_FIRST_TURN: {
+        "model": "gemini-2.0-flash",
+        "fallback_model": "gemini-2.0-flash-lite",
+        "latency_slo": 8.0,
+        "generation_config": {
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 2048,
+        },
+    },
+    GUIDED_PM: {
+        "model": "gemini-2.0-flash",
+        "fallback_model": "gemini-2.0-flash-lite",
+        "latency_slo": 20.0,
+        "generation_config": {
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 4096,
+        },
+    },
+    GUIDED_GP: {
+        "model": "gemini-2.0-flash",
+        "fallback_model": "gemini-2.0-flash-lite",
+        "latency_slo": 20.0,
+        "generation_config": {
+            "temperature": 0.8,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 4096,
+        },
+    },
+    # One section of a guided report generated on its own
+    GUIDED_SECTION: {
+        "model": "gemini-2.0-flash",
+        "fallback_model": "gemini-2.0-flash-lite",
+        "latency_slo": 8.0,
+        "generation_config": {
+            "temperature": 0.7,
+            "top_p": 0.95,
+            "top_k": 40,
+            "max_output_tokens": 1024,
+        },
+    },
+}
+
+
+def load_routes():
+    """
+    Load the routing rules, applying overrides from the environment
+
+    Returns:
+        dict: Routing rules keyed by request class
+    """
+    routes = json.loads(json.dumps(DEFAULT_ROUTES))
+
+    overrides = {}
+    routes_file = os.getenv("MODEL_ROUTES_FILE")
+    if routes_file and os.path.exists(routes_file):
+        with open(routes_file, encoding="utf-8") as f:
+            overrides.update(json.load(f))
+    if os.getenv("MODEL_ROUTES"):
+        overrides.update(json.loads(os.getenv("MODEL_ROUTES")))
+
+    for request_class, rule in overrides.items():
+        base = routes.setdefault(request_class, json.loads(json.dumps(DEFAULT_ROUTES[DIRECT_FIRST_TURN])))
+        generation_config = rule.pop("generation_config", None)
+        base.update(rule)
+        if generation_config:
+            base["generation_config"].update(generation_config)
+
+    return routes
+
+
+def classify_request(prompt, chat_history=None, guided=False, project_type="pm"):
+    """
+    Classify a request so it can be routed to a suitable model
+
+    Args:
+        prompt (str): The user's question or the generated prompt
+        chat_history (list, optional): Chat history sent with the request
+        guided (bool): Whether the request comes from the guided questionnaire
+        project_type (str): The type of project ("pm" or "gp")
+
+    Returns:
+        str: The request class
+    """
+    if guided:
+        return GUIDED_PM if project_type == "pm" else GUIDED_GP
+    if chat_history and len(prompt) <= SHORT_FOLLOWUP_MAX_CHARS:
+        return SHORT_FOLLOWUP
+    return DIRECT_FIRST_TURN
+
+
+def _latency_key(request_class, model_name):
+    return f"{request_class}/{model_name}"
+
+
+class LatencyTracker:
+    """Keeps a sliding window of observed call latencies per key (request class and model)"""
+
+    def __init__(self, window=50):
+        self.window = window
+        self._samples = {}
+        self._last_seen = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.setdefault(key, deque(maxlen=self.window))
+            samples.append(seconds)
+            self._last_seen[key] = time.monotonic()
+
+    def percentile(self, key, pct=90):
+        """Return the given latency percentile for a key, or None without samples"""
+        with self._lock:
+            samples = sorted(self._samples.get(key, ()))
+        if not samples:
+            return None
+        index = min(len(samples) - 1, int(round(pct / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+    def seconds_since_last(self, key):
+        with self._lock:
+            last = self._last_seen.get(key)
+        return None if last is None else time.monotonic() - last
+
+    def snapshot(self):
+        with self._lock:
+            models = list(self._samples)
+        return {
+            name: {
+                "p50": self.percentile(name, 50),
+                "p90": self.percentile(name, 90),
+                "samples": len(self._samples[name]),
+            }
+            for name in models
+        }
+
+
+class ModelRouter:
+    """
+    Picks the model and generation config for each request class.
+
+    When the observed p90 latency of the primary model is above the route's
+    latency SLO, requests are sent to the faster fallback model. The primary is
+    still probed every `probe_interval` seconds so the route recovers once its
+    latency is back under the SLO. A probe is counted when it is dispatched, so
+    a slow primary gets one probe per interval rather than all traffic until
+    the first probe completes.
+
+    Latency is tracked per request class and model, since classes sharing a
+    model produce very different output lengths (a guided report takes far
+    longer than a short follow-up on the same model).
+    """
+
+    def __init__(self, routes=None, tracker=None, probe_interval=30.0):
+        self.routes = routes if routes is not None else load_routes()
+        self.tracker = tracker or LatencyTracker()
+        self.probe_interval = probe_interval
+        self._probed_at = {}
+        self._probe_lock = threading.Lock()
+
+    def route(self, request_class):
+        """
+        Select the model for a request class
+
+        Args:
+            request_class (str): One of the request class constants
+
+        Returns:
+            dict: The chosen route with "model", "fallback_model",
+                "latency_slo" and "generation_config" keys
+        """
+        rule = self.routes.get(request_class) or self.routes[DIRECT_FIRST_TURN]
+        route = dict(rule, request_class=request_class)
+
+        fallback = rule.get("fallback_model")
+        if fallback and self._over_slo(request_class, rule["model"], rule.get("latency_slo")):
+            route["model"], route["fallback_model"] = fallback, None
+        return route
+
+    def record(self, request_class, model_name, seconds):
+        self.tracker.record(_latency_key(request_class, model_name), seconds)
+
+    def expected_latency(self, request_class, model_name, pct=50):
+        """Return the observed latency percentile of a model for a request class, or None"""
+        return self.tracker.percentile(_latency_key(request_class, model_name), pct)
+
+    def _over_slo(self, request_class, model_name, latency_slo):
+        if not latency_slo:
+            return False
+        key = _latency_key(request_class, model_name)
+        p90 = self.tracker.percentile(key, 90)
+        if p90 is None or p90 <= latency_slo:
+            return False
+        # Let a probe through periodically so the primary can recover
+        with self._probe_lock:
+            now = time.monotonic()
+            since_last = self.tracker.seconds_since_last(key)
+            probed_at = self._probed_at.get(key)
+            if probed_at is not None:
+                since_last = min(since_last, now - probed_at)
+            if since_last < self.probe_interval:
+                return True
+            self._probed_at[key] = now
+            return False
+
+    def stats(self):
+        return {
+            "routes": {name: rule["model"] for name, rule in self.routes.items()},
+            "latency": self.tracker.snapshot(),
+        }
+
+
+router = ModelRouter()
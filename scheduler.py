@@ -0,0 +1,266 @@
+import os
+import json
+import time
+import heapq
+import itertools
+import threading
+import contextvars
+from concurrent.futures import Future
+from deadlines import DeadlineExceeded
+
+# Priority classes, lower value is served first
+INTERACTIVE = 0
+GUIDED = 1
+BATCH = 2
+
+PRIORITY_NAMES = {INTERACTIVE: "interactive", GUIDED: "guided", BATCH: "batch"}
+PRIORITY_BY_NAME = {name: value for value, name in PRIORITY_NAMES.items()}
+
+# Marks scheduler worker threads, see PriorityScheduler.in_worker
+_worker_state = threading.local()
+
+
+class QueueFullError(Exception):
+    """Raised when a job cannot be queued because the scheduler is full"""
+
+
+class PreemptedError(Exception):
+    """Set on a queued job that was dropped to make room for higher priority work"""
+
+
+def load_tenant_weights():
+    """
+    Load per-tenant weights for fair queuing from the TENANT_WEIGHTS environment
+    variable, e.g. TENANT_WEIGHTS={"mobile-app": 4, "lms-sync": 1}. Requests
+    sent with an API key are charged to the key's identifier (client_key_id in
+    api.py, "key-" and 16 hex digits), so weight those clients by it.
+
+    Returns:
+        dict: Weight per tenant
+    """
+    raw = os.getenv("TENANT_WEIGHTS")
+    return {k: float(v) for k, v in json.loads(raw).items()} if raw else {}
+
+
+class _Job:
+    __slots__ = ("fn", "args", "kwargs", "future", "priority", "tenant", "enqueued_at", "context", "queued")
+
+    def __init__(self, fn, args, kwargs, priority, tenant):
+        self.fn = fn
+        self.args = args
+        self.kwargs = kwargs
+        self.future = Future()
+        self.priority = priority
+        self.tenant = tenant
+        self.enqueued_at = time.monotonic()
+        self.queued = True
+        # Run the job in the submitter's context so context variables follow it
+        self.context = contextvars.copy_context()
+
+
+class PriorityScheduler:
+    """
+    Schedules model calls over a fixed number of worker threads.
+
+    Jobs are served strictly by priority class (interactive > guided > batch).
+    Inside a class, tenants share the workers through weighted fair queuing:
+    each job gets a virtual finish tag of max(class virtual time, tenant's last
+    tag) + cost / weight, and the smallest tag runs next. A tenant submitting a
+    large burst therefore only delays its own later jobs.
+
+    Only queued jobs can be preempted; running calls always complete. A job
+    whose keyword arguments include a `deadline` is dropped with
+    DeadlineExceeded if the deadline passes while it is still queued.
+    """
+
+    def __init__(self, max_workers=None, max_queue_depth=None, tenant_weights=None):
+        self.max_workers = max_workers or int(os.getenv("SCHEDULER_WORKERS", "8"))
+        self.max_queue_depth = max_queue_depth or int(os.getenv("SCHEDULER_MAX_QUEUE", "200"))
+        self.tenant_weights = tenant_weights if tenant_weights is not None else load_tenant_weights()
+
+        self._queues = {priority: [] for priority in PRIORITY_NAMES}
+        self._virtual_time = {priority: 0.0 for priority in PRIORITY_NAMES}
+        self._last_tag = {}
+        self._prune_at = 1024
+        self._sequence = itertools.count()
+        self._queued = 0
+        self._running = 0
+        self._cond = threading.Condition()
+        self._metrics = {
+            priority: {"submitted": 0, "completed": 0, "failed": 0, "preempted": 0,
+                       "rejected": 0, "expired": 0, "wait_total": 0.0, "wait_max": 0.0}
+            for priority in PRIORITY_NAMES
+        }
+
+        self._workers = [
+            threading.Thread(target=self._worker, name=f"scheduler-{i}", daemon=True)
+            for i in range(self.max_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, fn, *args, priority=INTERACTIVE, tenant="anonymous", cost=1.0, **kwargs):
+        """
+        Queue a call and return a Future for its result
+
+        Args:
+            fn (callable): The function to run
+            priority (int): INTERACTIVE, GUIDED or BATCH
+            tenant (str): Tenant (API key or client id) the work is charged to
+            cost (float): Relative cost of the job for fair queuing
+
+        Returns:
+            concurrent.futures.Future: Resolves to the return value of fn
+        """
+        job = _Job(fn, args, kwargs, priority, tenant)
+        with self._cond:
+            if self._queued >= self.max_queue_depth and not self._preempt_one(below=priority):
+                self._metrics[priority]["rejected"] += 1
+                raise QueueFullError("Scheduler queue is full")
+
+            if len(self._last_tag) >= self._prune_at:
+                self._prune_tags()
+            weight = self.tenant_weights.get(tenant, 1.0)
+            start = max(self._virtual_time[priority], self._last_tag.get((priority, tenant), 0.0))
+            tag = start + cost / weight
+            self._last_tag[(priority, tenant)] = tag
+
+            heapq.heappush(self._queues[priority], (tag, next(self._sequence), job))
+            self._queued += 1
+            self._metrics[priority]["submitted"] += 1
+            self._cond.notify()
+        return job.future
+
+    def run(self, fn, *args, **kwargs):
+        """Submit a call and block until its result is available"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def preempt(self, priority=BATCH, tenant=None):
+        """
+        Drop queued (not running) jobs of the given priority class
+
+        Args:
+            priority (int): Priority class to drop
+            tenant (str, optional): Only drop jobs of this tenant
+
+        Returns:
+            int: Number of jobs dropped
+        """
+        dropped = 0
+        with self._cond:
+            for _, _, job in self._queues[priority]:
+                if (tenant is None or job.tenant == tenant) and self._drop(job):
+                    dropped += 1
+        return dropped
+
+    def in_worker(self):
+        """
+        Whether the current thread is a scheduler worker. Work running on a
+        worker must not submit jobs and wait for them: with every worker doing
+        that, the queued jobs would never run.
+        """
+        return getattr(_worker_state, "active", False)
+
+    def stats(self):
+        """Return queue depth and wait-time metrics per priority class"""
+        with self._cond:
+            classes = {}
+            for priority, name in PRIORITY_NAMES.items():
+                metrics = self._metrics[priority]
+                started = metrics["completed"] + metrics["failed"]
+                depth = sum(1 for _, _, job in self._queues[priority] if not job.future.done())
+                classes[name] = {
+                    "queue_depth": depth,
+                    "submitted": metrics["submitted"],
+                    "completed": metrics["completed"],
+                    "failed": metrics["failed"],
+                    "preempted": metrics["preempted"],
+                    "rejected": metrics["rejected"],
+                    "expired": metrics["expired"],
+                    "avg_wait_seconds": metrics["wait_total"] / started if started else 0.0,
+                    "max_wait_seconds": metrics["wait_max"],
+                }
+            return {"running": self._running, "workers": self.max_workers, "classes": classes}
+
+    def _prune_tags(self):
+        # A tag at or below its class virtual time has no effect on the next
+        # job's start, so forgetting it is safe and keeps the map bounded
+        self._last_tag = {
+            key: tag for key, tag in self._last_tag.items()
+            if tag > self._virtual_time[key[0]]
+        }
+        self._prune_at = max(1024, 2 * len(self._last_tag))
+
+    def _drop(self, job):
+        # Dropped jobs stay in the heap and are skipped when popped
+        if job.future.done():
+            return False
+        job.future.set_exception(PreemptedError("Job was preempted by higher priority work"))
+        self._release(job)
+        self._metrics[job.priority]["preempted"] += 1
+        return True
+
+    def _preempt_one(self, below):
+        # Drop the job with the largest finish tag from the lowest class under
+        # `below`: the last job of the tenant furthest ahead of its fair share
+        for priority in sorted(self._queues, reverse=True):
+            if priority <= below:
+                break
+            candidates = [entry for entry in self._queues[priority] if not entry[2].future.done()]
+            if candidates:
+                return self._drop(max(candidates, key=lambda entry: entry[:2])[2])
+        return False
+
+    def _release(self, job):
+        if job.queued:
+            job.queued = False
+            self._queued -= 1
+
+    def _next_job(self):
+        for priority in sorted(self._queues):
+            queue = self._queues[priority]
+            while queue:
+                tag, _, job = heapq.heappop(queue)
+                self._release(job)
+                if job.future.done():
+                    continue
+                self._virtual_time[priority] = tag
+                deadline = job.kwargs.get("deadline")
+                if deadline is not None and deadline.expired():
+                    job.future.set_exception(DeadlineExceeded("Request deadline exceeded while queued"))
+                    self._metrics[priority]["expired"] += 1
+                    continue
+                return job
+        return None
+
+    def _worker(self):
+        _worker_state.active = True
+        while True:
+            with self._cond:
+                job = self._next_job()
+                while job is None:
+                    self._cond.wait()
+                    job = self._next_job()
+                if not job.future.set_running_or_notify_cancel():
+                    continue
+                self._running += 1
+                wait = time.monotonic() - job.enqueued_at
+                metrics = self._metrics[job.priority]
+                metrics["wait_total"] += wait
+                metrics["wait_max"] = max(metrics["wait_max"], wait)
+
+            try:
+                result = job.context.run(job.fn, *job.args, **job.kwargs)
+            except BaseException as e:
+                job.future.set_exception(e)
+                outcome = "failed"
+            else:
+                job.future.set_result(result)
+                outcome = "completed"
+
+            with self._cond:
+                self._running -= 1
+                self._metrics[job.priority][outcome] += 1
+
+
+scheduler = PriorityScheduler()
@@ -0,0 +1,264 @@
+import os
+import json
+import time
+import atexit
+import sqlite3
+import threading
+import contextvars
+from contextlib import contextmanager
+
+# Labels the current request's token usage is charged to, see set_usage_labels.
+# The scheduler and the job pool run work in a copy of the submitter's context,
+# so labels set by an API handler follow its model calls.
+usage_labels = contextvars.ContextVar("usage_labels", default={})
+
+DIMENSIONS = ("session", "tenant", "endpoint", "project_type", "model", "request_class", "outcome")
+GROUP_BY = DIMENSIONS + ("day",)
+
+# Call outcomes. Cancelled calls (deadline passed or client gone) and failed
+# calls are recorded too, since the upstream may still bill them.
+OUTCOMES = ("ok", "cancelled", "error")
+
+# Characters per token used to estimate usage the upstream did not report
+CHARS_PER_TOKEN = float(os.getenv("USAGE_CHARS_PER_TOKEN", "3"))
+
+# USD per million tokens. Cached tokens are billed at the cached rate instead
+# of the input rate. Override with the MODEL_PRICES environment variable (JSON).
+DEFAULT_PRICES = {
+    "gemini-2.0-flash": {"input": 0.10, "output": 0.40, "cached": 0.025},
+    "gemini-2.0-flash-lite": {"input": 0.075, "output": 0.30, "cached": 0.01875},
+}
+
+_COUNTERS = ("calls", "prompt_tokens", "output_tokens", "total_tokens", "cached_tokens",
+             "cost_usd", "latency_seconds")
+
+
+def set_usage_labels(**labels):
+    """
+    Label the token usage of the current context, e.g.
+    set_usage_labels(endpoint="direct-question", tenant="mobile-app", session="abc")
+
+    Labels left out keep their current value.
+    """
+    usage_labels.set({**usage_labels.get(), **labels})
+
+
+def estimate_tokens(chars):
+    """Rough token count of a text of `chars` characters"""
+    return int(-(-chars // CHARS_PER_TOKEN)) if chars else 0
+
+
+def load_prices():
+    prices = json.loads(json.dumps(DEFAULT_PRICES))
+    if os.getenv("MODEL_PRICES"):
+        for model_name, price in json.loads(os.getenv("MODEL_PRICES")).items():
+            prices.setdefault(model_name, {}).update(price)
+    return prices
+
+
+class UsageMeter:
+    """
+    Aggregates token usage of model calls in memory and periodically flushes
+    it to a SQLite database.
+
+    Each call adds to one counter row keyed by day and the labels in DIMENSIONS,
+    so recording is a dict update under a lock. A background thread writes the
+    pending rows every `flush_interval` seconds, adding them to the stored
+    totals; reports are read from the database after a flush.
+    """
+
+    def __init__(self, db_path=None, flush_interval=None, prices=None):
+        self.db_path = db_path or os.getenv("USAGE_DB_PATH", "usage.db")
+        self.flush_interval = flush_interval or float(os.getenv("USAGE_FLUSH_SECONDS", "30"))
+        self.prices = prices if prices is not None else load_prices()
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._flusher = None
+        self._schema_ready = False
+
+    def record(self, usage_metadata, model=None, request_class=None, latency=None, outcome="ok",
+               prompt_chars=0, output_chars=0):
+        """
+        Add the usage of one model call, charged to the current usage labels
+
+        Args:
+            usage_metadata: The response's usage_metadata, may be None
+            model (str, optional): Model that served the call
+            request_class (str, optional): Routing class of the call
+            latency (float, optional): Call duration in seconds
+            outcome (str): One of OUTCOMES
+            prompt_chars (int): Prompt length, used to estimate prompt tokens
+                when usage_metadata is None
+            output_chars (int): Length of the text received, used to estimate
+                output tokens when usage_metadata is None
+        """
+        if usage_metadata is None:
+            prompt_tokens = estimate_tokens(prompt_chars)
+            output_tokens = estimate_tokens(output_chars)
+        else:
+            prompt_tokens = getattr(usage_metadata, "prompt_token_count", 0) or 0
+            output_tokens = getattr(usage_metadata, "candidates_token_count", 0) or 0
+        total_tokens = getattr(usage_metadata, "total_token_count", 0) or prompt_tokens + output_tokens
+        cached_tokens = getattr(usage_metadata, "cached_content_token_count", 0) or 0
+
+        price = self.prices.get(model, {})
+        cost = (
+            (prompt_tokens - cached_tokens) * price.get("input", 0)
+            + cached_tokens * price.get("cached", price.get("input", 0))
+            + output_tokens * price.get("output", 0)
+        ) / 1e6
+
+        labels = usage_labels.get()
+        key = (
+            time.strftime("%Y-%m-%d"),
+            labels.get("session") or "",
+            labels.get("tenant") or "",
+            labels.get("endpoint") or "",
+            labels.get("project_type") or "",
+            model or "",
+            request_class or "",
+            outcome,
+        )
+        with self._lock:
+            counters = self._pending.get(key)
+            if counters is None:
+                counters = self._pending[key] = [0, 0, 0, 0, 0, 0.0, 0.0]
+            counters[0] += 1
+            counters[1] += prompt_tokens
+            counters[2] += output_tokens
+            counters[3] += total_tokens
+            counters[4] += cached_tokens
+            counters[5] += cost
+            counters[6] += latency or 0.0
+        self._start_flusher()
+
+    def flush(self):
+        """Write pending counters to the database; returns the number of rows written"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return 0
+        try:
+            with self._flush_lock, self._database() as db:
+                db.executemany(
+                    f"""
+                    INSERT INTO usage (day, {", ".join(DIMENSIONS)}, {", ".join(_COUNTERS)})
+                    VALUES ({", ".join("?" * (1 + len(DIMENSIONS) + len(_COUNTERS)))})
+                    ON CONFLICT (day, {", ".join(DIMENSIONS)}) DO UPDATE SET
+                    {", ".join(f"{name} = {name} + excluded.{name}" for name in _COUNTERS)}
+                    """,
+                    [key + tuple(counters) for key, counters in pending.items()]
+                )
+        except sqlite3.Error:
+            # Keep the counters for the next flush
+            with self._lock:
+                for key, counters in pending.items():
+                    current = self._pending.setdefault(key, [0, 0, 0, 0, 0, 0.0, 0.0])
+                    for i, value in enumerate(counters):
+                        current[i] += value
+            raise
+        return len(pending)
+
+    def report(self, group_by="tenant", since=None, limit=50, **filters):
+        """
+        Return usage totals grouped by one dimension, largest cost first
+
+        Args:
+            group_by (str): One of GROUP_BY
+            since (str, optional): First day to include, as YYYY-MM-DD
+            limit (int): Maximum number of groups
+            **filters: Only include rows whose labels equal these values
+
+        Returns:
+            list: One dict per group with token, cost and latency totals
+        """
+        if group_by not in GROUP_BY:
+            raise ValueError(f"group_by must be one of {', '.join(GROUP_BY)}")
+        unknown = set(filters) - set(DIMENSIONS)
+        if unknown:
+            raise ValueError(f"Unknown filter: {', '.join(sorted(unknown))}")
+
+        self.flush()
+        conditions, params = [], []
+        if since:
+            conditions.append("day >= ?")
+            params.append(since)
+        for name, value in filters.items():
+            if value is not None:
+                conditions.append(f"{name} = ?")
+                params.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        with self._database() as db:
+            rows = db.execute(
+                f"""
+                SELECT {group_by}, {", ".join(f"SUM({name})" for name in _COUNTERS)}
+                FROM usage {where}
+                GROUP BY {group_by}
+                ORDER BY SUM(cost_usd) DESC, SUM(total_tokens) DESC
+                LIMIT ?
+                """,
+                params + [limit]
+            ).fetchall()
+
+        report = []
+        for row in rows:
+            entry = {group_by: row[0]}
+            entry.update(zip(_COUNTERS, row[1:]))
+            entry["avg_latency_seconds"] = entry["latency_seconds"] / entry["calls"] if entry["calls"] else 0.0
+            report.append(entry)
+        return report
+
+    @contextmanager
+    def _database(self):
+        # One short-lived connection per flush or report, committed on success
+        db = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            with db:
+                if not self._schema_ready:
+                    self._create_schema(db)
+                yield db
+        finally:
+            db.close()
+
+    def _create_schema(self, db):
+        db.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS usage (
+                day TEXT NOT NULL,
+                {", ".join(f"{name} TEXT NOT NULL" for name in DIMENSIONS)},
+                calls INTEGER NOT NULL,
+                prompt_tokens INTEGER NOT NULL,
+                output_tokens INTEGER NOT NULL,
+                total_tokens INTEGER NOT NULL,
+                cached_tokens INTEGER NOT NULL,
+                cost_usd REAL NOT NULL,
+                latency_seconds REAL NOT NULL,
+                PRIMARY KEY (day, {", ".join(DIMENSIONS)})
+            )
+            """
+        )
+        self._schema_ready = True
+
+    def _start_flusher(self):
+        if self._flusher is not None:
+            return
+        with self._lock:
+            if self._flusher is not None:
+                return
+            self._flusher = threading.Thread(target=self._flush_periodically, name="usage-flush", daemon=True)
+            self._flusher.start()
+        atexit.register(self.flush)
+
+    def _flush_periodically(self):
+        while True:
+            time.sleep(self.flush_interval)
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # Retried with the next flush
+                pass
+
+
+usage_meter = UsageMeter()
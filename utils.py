@@ -1,31 +1,216 @@
 from email import message
 import os
+import re
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import as_completed
 import google.generativeai as genai
+import google.ai.generativelanguage as glm
 from dotenv import load_dotenv
 import streamlit as st
 from prompts import (
     SYSTEM_PROMPT, PM_GUIDED_GENERATION_TEMPLATE, GP_GUIDED_GENERATION_TEMPLATE,
-    PM_DIRECT_MODE_TEMPLATE, GP_DIRECT_MODE_TEMPLATE
+    PM_DIRECT_MODE_TEMPLATE, GP_DIRECT_MODE_TEMPLATE,
+    GREETING_RESPONSE, THANKS_RESPONSE, EMPTY_INPUT_RESPONSE, TOO_LONG_INPUT_RESPONSE,
+    UNSUPPORTED_LANGUAGE_RESPONSE, SPAM_INPUT_RESPONSE, DUPLICATE_PENDING_RESPONSE,
+    GREETING_PHRASES, THANKS_PHRASES, MODEL_ERROR_RESPONSE, BUSY_FALLBACK_RESPONSE,
+    PM_GUIDED_SECTIONS, GP_GUIDED_SECTIONS, GUIDED_SECTION_TEMPLATE, PM_KEYWORDS, GP_KEYWORDS
 )
+from routing import router, classify_request, GUIDED_SECTION
+from deadlines import DeadlineExceeded, MIN_GENERATION_SECONDS
+from cache import TTLCache
+from usage import usage_meter
+from scheduler import scheduler, GUIDED
+from key_pool import KeyPool, NoKeyAvailableError, load_api_keys
 
 # Load environment variables
 load_dotenv()
 messages = []
 
+# Recent answers to requests without chat history, served when a request's
+# deadline leaves no time for a fresh generation. Follow-ups are never cached:
+# their meaning depends on the conversation, which is not part of the key.
+response_cache = TTLCache(
+    maxsize=int(os.getenv("RESPONSE_CACHE_SIZE", "1000")),
+    ttl=int(os.getenv("RESPONSE_CACHE_TTL", "86400"))
+)
+
+# Sections of guided reports, cached per section and relevant answers. Sections
+# that depend on few answers (e.g. learning resources per field of study) are
+# shared between users.
+section_cache = TTLCache(
+    maxsize=int(os.getenv("SECTION_CACHE_SIZE", "2000")),
+    ttl=int(os.getenv("SECTION_CACHE_TTL", "86400"))
+)
+
+# API keys used for model calls, see key_pool.py
+key_pool = KeyPool()
+_key_clients = {}
+
 # Configure Gemini API
 def setup_openai():
     """
-    Setup the Gemini API with the API key from environment variables
+    Setup the Gemini API with the API keys from environment variables
     """
-    api_key = os.getenv("GEMINI_API_KEY")
-    if not api_key:
+    api_keys = load_api_keys()
+    if not api_keys:
         st.error("Gemini API key not found. Please check your .env file.")
         st.stop()
     
-    genai.configure(api_key=api_key)
+    genai.configure(api_key=api_keys[0])
+    key_pool.load(api_keys)
+
+
+def _make_model(model_name, generation_config, api_key):
+    """
+    Create a model bound to the given API key
+
+    genai.configure() sets a single global key, so with several keys each one
+    gets its own client, see _bind_client.
+    """
+    model = genai.GenerativeModel(
+        model_name=model_name,
+        generation_config=generation_config,
+        safety_settings=SAFETY_SETTINGS
+    )
+    if len(key_pool) > 1:
+        _bind_client(model, api_key)
+    return model
+
+
+def _bind_client(model, api_key):
+    """
+    Make a model send its calls with the given API key
+
+    google-generativeai has no public way to give one model its own key: the
+    model uses the client built by genai.configure() unless its `_client`
+    attribute is already set. This is the only place relying on that, which is
+    why requirements.txt pins the SDK to the 0.8 series.
+    """
+    if not hasattr(model, "_client"):
+        raise RuntimeError("Unsupported google-generativeai version: GenerativeModel has no _client")
+    if api_key not in _key_clients:
+        _key_clients[api_key] = glm.GenerativeServiceClient(client_options={"api_key": api_key})
+    model._client = _key_clients[api_key]
+
 
+SAFETY_SETTINGS = [
+    {
+        "category": "HARM_CATEGORY_HARASSMENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_HATE_SPEECH",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    },
+    {
+        "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
+        "threshold": "BLOCK_MEDIUM_AND_ABOVE"
+    }
+]
 
-def get_openai_response(prompt, system_prompt=SYSTEM_PROMPT, chat_history=None):
+
+def build_full_prompt(prompt, system_prompt=SYSTEM_PROMPT, chat_history=None):
+    """
+    Combine the system prompt, chat history and current prompt into a single prompt
+    
+    Args:
+        prompt (str): The prompt to send to the model
+        system_prompt (str): The system prompt to use
+        chat_history (list, optional): Chat history for contextual responses
+    
+    Returns:
+        str: The full prompt
+    """
+    if chat_history:
+        # Format the chat history as part of the prompt. Parts are joined once at
+        # the end so long histories are not copied again for every message.
+        parts = [system_prompt, "\n\n--- سجل المحادثة السابق ---\n\n"]
+        for msg in chat_history:
+            role = "المستخدم" if msg["role"] == "user" else "المساعد"
+            parts += (role, ": ", msg["content"], "\n\n")
+        
+        # Combine everything into a single prompt
+        parts.append(f"--- السؤال الحالي ---\n\nالمستخدم: {prompt}\n\nالمساعد:")
+        return "".join(parts)
+    
+    # If no history, just use the system prompt and current query
+    return f"{system_prompt}\n\nالمستخدم: {prompt}\n\nالمساعد:"
+
+
+def _response_cache_key(request_class, prompt, chat_history):
+    return None if chat_history else (request_class, prompt)
+
+
+def fallback_response(cache_key):
+    """Return a cached answer for the request, or the precomputed busy reply"""
+    if cache_key is None:
+        return BUSY_FALLBACK_RESPONSE
+    return response_cache.get(cache_key) or BUSY_FALLBACK_RESPONSE
+
+
+def _generate(model, full_prompt, deadline=None, progress=None):
+    """
+    Run a generation, stopping early if the deadline passes or is cancelled
+
+    Without a deadline this is a plain blocking call. With one, the response is
+    streamed so the upstream generation can be abandoned between chunks, and
+    the HTTP call itself is bounded by the remaining budget.
+
+    Args:
+        progress (dict, optional): Updated as the call goes, see _record_usage,
+            so usage is known even when the generation is abandoned
+
+    Returns:
+        tuple: (text, usage_metadata)
+    """
+    progress = {} if progress is None else progress
+    if deadline is None:
+        response = model.generate_content(full_prompt)
+        progress["opened"] = True
+        progress["usage"] = getattr(response, "usage_metadata", None)
+        return response.text, progress["usage"]
+
+    deadline.check()
+    chunks = []
+    stream = model.generate_content(
+        full_prompt,
+        stream=True,
+        request_options={"timeout": deadline.remaining()}
+    )
+    progress["opened"] = True
+    for chunk in stream:
+        deadline.check()
+        chunks.append(chunk.text)
+        progress["output_chars"] = progress.get("output_chars", 0) + len(chunk.text)
+        progress["usage"] = getattr(chunk, "usage_metadata", None) or progress.get("usage")
+    return "".join(chunks), progress.get("usage")
+
+
+def _record_usage(lease, progress, model_name, request_class, started, outcome, full_prompt):
+    """
+    Charge a model call to its key and to the usage meter, whatever its outcome
+
+    Abandoned and failed calls are billed too. When the upstream accepted the
+    call but never reported usage, the tokens are estimated from the prompt and
+    the text received so far.
+    """
+    usage = progress.get("usage")
+    lease.record_tokens(getattr(usage, "total_token_count", 0))
+    usage_meter.record(
+        usage, model_name, request_class, time.monotonic() - started, outcome=outcome,
+        prompt_chars=len(full_prompt) if progress.get("opened") else 0,
+        output_chars=progress.get("output_chars", 0)
+    )
+
+
+def get_openai_response(prompt, system_prompt=SYSTEM_PROMPT, chat_history=None, request_class=None, deadline=None):
     """
     Get a response from the Gemini model
     
@@ -33,111 +218,352 @@ def get_openai_response(prompt, system_prompt=SYSTEM_PROMPT, chat_history=None):
         prompt (str): The prompt to send to the model
         system_prompt (str): The system prompt to use
         chat_history (list, optional): Chat history for contextual responses
+        request_class (str, optional): Routing class of the request, see routing.py.
+            Classified from the prompt and chat history when not given.
+        deadline (Deadline, optional): Request deadline. When too little time is
+            left for a fresh generation, a cached or precomputed answer is returned.
     
     Returns:
         str: The model's response
     """
     try:
-        # Create the generation config with safety settings
-        generation_config = {
-            "temperature": 0.7,
-            "top_p": 0.95,
-            "top_k": 40,
-            "max_output_tokens": 2048,
-        }
+        if request_class is None:
+            request_class = classify_request(prompt, chat_history)
+        route = router.route(request_class)
+        cache_key = _response_cache_key(request_class, prompt, chat_history)
         
-        safety_settings = [
-            {
-                "category": "HARM_CATEGORY_HARASSMENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_HATE_SPEECH",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_SEXUALLY_EXPLICIT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            },
-            {
-                "category": "HARM_CATEGORY_DANGEROUS_CONTENT",
-                "threshold": "BLOCK_MEDIUM_AND_ABOVE"
-            }
-        ]
+        # Skip the model when the remaining budget is below its typical latency
+        if deadline is not None:
+            expected = router.expected_latency(request_class, route["model"]) or MIN_GENERATION_SECONDS
+            if deadline.remaining() < expected:
+                return fallback_response(cache_key)
         
-        model = genai.GenerativeModel(
-            model_name="gemini-2.0-flash",
-            generation_config=generation_config,
-            safety_settings=safety_settings
-        )
+        full_prompt = build_full_prompt(prompt, system_prompt, chat_history)
         
-        # Format the prompt with system prompt and chat history
-        if chat_history:
-            # Format the chat history as part of the prompt
-            conversation_context = ""
-            for msg in chat_history:
-                role = "المستخدم" if msg["role"] == "user" else "المساعد"
-                content = msg["content"]
-                conversation_context += f"{role}: {content}\n\n"
-            
-            # Combine everything into a single prompt
-            full_prompt = f"{system_prompt}\n\n--- سجل المحادثة السابق ---\n\n{conversation_context}--- السؤال الحالي ---\n\nالمستخدم: {prompt}\n\nالمساعد:"
-        else:
-            # If no history, just use the system prompt and current query
-            full_prompt = f"{system_prompt}\n\nالمستخدم: {prompt}\n\nالمساعد:"
+        # Generate the response with the routed model, cascading to the
+        # fallback model if the primary one fails
+        models = [route["model"]]
+        if route.get("fallback_model"):
+            models.append(route["fallback_model"])
         
-        # Generate the response with the full context
-        response = model.generate_content(full_prompt)
+        for attempt, model_name in enumerate(models):
+            started = time.monotonic()
+            cancelled = None
+            try:
+                with key_pool.acquire() as lease:
+                    model = _make_model(model_name, route["generation_config"], lease.key)
+                    progress = {}
+                    outcome = "error"
+                    try:
+                        response_text, usage = _generate(model, full_prompt, deadline, progress)
+                        outcome = "ok"
+                    except DeadlineExceeded as e:
+                        # A cancelled request is not the key's fault
+                        cancelled = e
+                        outcome = "cancelled"
+                    finally:
+                        _record_usage(lease, progress, model_name, request_class, started, outcome, full_prompt)
+                if cancelled:
+                    raise cancelled
+            except (DeadlineExceeded, NoKeyAvailableError):
+                # Neither says anything about the model's latency
+                raise
+            except Exception:
+                router.record(request_class, model_name, time.monotonic() - started)
+                if attempt == len(models) - 1 or (deadline is not None and deadline.expired()):
+                    raise
+                continue
+            router.record(request_class, model_name, time.monotonic() - started)
+            break
 
         # Add the current user message
         messages.append({"role": "user", "content": prompt})
-        return response.text
+        if cache_key is not None:
+            response_cache.set(cache_key, response_text)
+        return response_text
     
+    except (DeadlineExceeded, NoKeyAvailableError):
+        # Out of time, or every API key is cooling down: degrade like a busy service
+        return fallback_response(cache_key)
     except Exception as e:
         st.error(f"Error getting response from Gemini: {str(e)}")
-        return "عذراً، حدث خطأ في الاتصال بنموذج الذكاء الاصطناعي. يرجى المحاولة مرة أخرى."
+        return MODEL_ERROR_RESPONSE
 
 
-def process_guided_questionnaire(responses, project_type="pm"):
+def stream_openai_response(prompt, system_prompt=SYSTEM_PROMPT, chat_history=None, request_class=None, deadline=None):
+    """
+    Stream a response from the Gemini model chunk by chunk
+    
+    Uses the same routing and deadline handling as get_openai_response. The
+    fallback model is only tried if the primary fails before producing any text.
+    
+    Args:
+        prompt (str): The prompt to send to the model
+        system_prompt (str): The system prompt to use
+        chat_history (list, optional): Chat history for contextual responses
+        request_class (str, optional): Routing class of the request, see routing.py
+        deadline (Deadline, optional): Request deadline; cancelling it stops the stream
+    
+    Yields:
+        str: Pieces of the model's response
+    
+    Raises:
+        DeadlineExceeded: If the deadline passes or is cancelled mid-stream
+    """
+    if request_class is None:
+        request_class = classify_request(prompt, chat_history)
+    route = router.route(request_class)
+    cache_key = _response_cache_key(request_class, prompt, chat_history)
+    
+    if deadline is not None:
+        expected = router.expected_latency(request_class, route["model"]) or MIN_GENERATION_SECONDS
+        if deadline.remaining() < expected:
+            yield fallback_response(cache_key)
+            return
+    
+    full_prompt = build_full_prompt(prompt, system_prompt, chat_history)
+    models = [route["model"]]
+    if route.get("fallback_model"):
+        models.append(route["fallback_model"])
+    
+    for attempt, model_name in enumerate(models):
+        request_options = {"timeout": deadline.remaining()} if deadline is not None else None
+        chunks = []
+        started = time.monotonic()
+        cancelled = None
+        try:
+            with key_pool.acquire() as lease:
+                model = _make_model(model_name, route["generation_config"], lease.key)
+                progress = {}
+                outcome = "error"
+                try:
+                    stream = model.generate_content(full_prompt, stream=True, request_options=request_options)
+                    progress["opened"] = True
+                    for chunk in stream:
+                        if deadline is not None:
+                            deadline.check()
+                        chunks.append(chunk.text)
+                        progress["output_chars"] = progress.get("output_chars", 0) + len(chunk.text)
+                        progress["usage"] = getattr(chunk, "usage_metadata", None) or progress.get("usage")
+                        yield chunk.text
+                    outcome = "ok"
+                except DeadlineExceeded as e:
+                    # A cancelled request is not the key's fault
+                    cancelled = e
+                    outcome = "cancelled"
+                except GeneratorExit:
+                    # The consumer stopped reading
+                    outcome = "cancelled"
+                    raise
+                finally:
+                    _record_usage(lease, progress, model_name, request_class, started, outcome, full_prompt)
+            if cancelled:
+                raise cancelled
+        except (DeadlineExceeded, NoKeyAvailableError):
+            raise
+        except Exception:
+            router.record(request_class, model_name, time.monotonic() - started)
+            if chunks or attempt == len(models) - 1:
+                raise
+            continue
+        router.record(request_class, model_name, time.monotonic() - started)
+        if cache_key is not None:
+            response_cache.set(cache_key, "".join(chunks))
+        return
+
+def process_guided_questionnaire(responses, project_type="pm", deadline=None, sectioned=False,
+                                 priority=GUIDED, tenant="anonymous"):
     """
     Process the responses from the guided questionnaire and generate advice or project ideas
     
     Args:
         responses (dict): The user's responses to the questionnaire
         project_type (str): The type of project ("pm" for project management, "gp" for graduation project)
+        deadline (Deadline, optional): Request deadline passed to the model call
+        sectioned (bool): Generate each report section with its own concurrent
+            call instead of one long generation, see iter_guided_sections
+        priority (int): Scheduler priority of the section calls when sectioned
+        tenant (str): Tenant the section calls are charged to when sectioned
         
     Returns:
         str: Generated advice or project ideas
     """
-    if project_type == "pm":
-        # Format template for project management advice
-        prompt = PM_GUIDED_GENERATION_TEMPLATE.format(
-            general_advice="نصائح عامة مخصصة بناءً على إجابات المستخدم",
-            suggested_tools="أدوات مقترحة بناءً على احتياجات المشروع",
-            best_practices="أفضل الممارسات في إدارة المشاريع البرمجية",
-            actionable_steps="خطوات عملية يمكن تطبيقها فوراً",
-            additional_resources="موارد إضافية للمساعدة في إدارة المشروع"
-        )
+    if sectioned:
+        sections = {
+            key: text for _, key, _, text
+            in iter_guided_sections(responses, project_type, deadline, priority=priority, tenant=tenant)
+        }
+        return stitch_guided_sections(sections, project_type)
+    
+    prompt = build_guided_prompt(responses, project_type)
+    request_class = classify_request(prompt, guided=True, project_type=project_type)
+    return get_openai_response(prompt, request_class=request_class, deadline=deadline)
+
+
+def build_guided_prompt(responses, project_type="pm"):
+    """
+    Build the single-call prompt for a guided report
+    
+    Args:
+        responses (dict): The user's responses to the questionnaire
+        project_type (str): The type of project ("pm" or "gp")
         
-    else:  # Graduation projects
-        # Format template for graduation project ideas
-        prompt = GP_GUIDED_GENERATION_TEMPLATE.format(
-            project_ideas="أفكار مشاريع مخصصة بناءً على مجال الدراسة والاهتمامات",
-            suggested_technologies="تقنيات مقترحة لتنفيذ المشاريع",
-            starting_steps="خطوات عملية لبدء تنفيذ المشروع",
-            challenges_and_solutions="تحديات محتملة وحلولها",
-            learning_resources="موارد تعليمية للمساعدة في تنفيذ المشروع"
-        )
+    Returns:
+        str: The prompt
+    """
+    sections = PM_GUIDED_SECTIONS if project_type == "pm" else GP_GUIDED_SECTIONS
+    template = PM_GUIDED_GENERATION_TEMPLATE if project_type == "pm" else GP_GUIDED_GENERATION_TEMPLATE
+    
+    # Format template for project management advice or graduation project ideas
+    prompt = template.format(**{section["key"]: section["instruction"] for section in sections})
     
     # Add the user's responses to help the model generate personalized advice
-    prompt += "\n\nإجابات المستخدم:\n"
-    for key, value in responses.items():
-        prompt += f"- {key}: {value}\n"
+    return prompt + format_answers(responses.items())
+
+
+def format_answers(answers):
+    """Format (question key, answer) pairs as the answers block of a guided prompt"""
+    return "\n\nإجابات المستخدم:\n" + "".join(f"- {key}: {value}\n" for key, value in answers)
+
+
+def generate_guided_section(section, responses, project_type="pm", deadline=None):
+    """
+    Generate one section of a guided report, using the section cache
+    
+    Args:
+        section (dict): Section definition from PM_GUIDED_SECTIONS or GP_GUIDED_SECTIONS
+        responses (dict): The user's responses to the questionnaire
+        project_type (str): The type of project ("pm" or "gp")
+        deadline (Deadline, optional): Request deadline passed to the model call
+        
+    Returns:
+        str: The section text
+    """
+    fields = section["fields"] or sorted(responses)
+    relevant = tuple((field, responses[field]) for field in fields if responses.get(field))
+    cache_key = (project_type, section["key"], relevant)
+    cached = section_cache.get(cache_key)
+    if cached is not None:
+        return cached
     
-    return get_openai_response(prompt)
+    prompt = GUIDED_SECTION_TEMPLATE.format(title=section["title"], instruction=section["instruction"])
+    prompt += format_answers(relevant)
+    
+    text = get_openai_response(prompt, request_class=GUIDED_SECTION, deadline=deadline)
+    if not section_failed(text):
+        section_cache.set(cache_key, text)
+    return text
 
 
-def process_direct_question(question, chat_history=None, project_type="pm"):
+def submit_guided_sections(responses, project_type="pm", deadline=None, priority=GUIDED, tenant="anonymous"):
+    """
+    Queue one scheduler job per section of a guided report
+    
+    Args:
+        responses (dict): The user's responses to the questionnaire
+        project_type (str): The type of project ("pm" or "gp")
+        deadline (Deadline, optional): Request deadline passed to each model call
+        priority (int): Scheduler priority of the section calls
+        tenant (str): Tenant the section calls are charged to
+        
+    Returns:
+        list: (index, section, future) per section, in template order
+    
+    Raises:
+        QueueFullError: If the scheduler cannot take every section; sections
+            already queued are cancelled
+    """
+    sections = PM_GUIDED_SECTIONS if project_type == "pm" else GP_GUIDED_SECTIONS
+    submitted = []
+    try:
+        for index, section in enumerate(sections):
+            future = scheduler.submit(
+                generate_guided_section, section, responses, project_type,
+                priority=priority, tenant=tenant, deadline=deadline
+            )
+            submitted.append((index, section, future))
+    except Exception:
+        for _, _, future in submitted:
+            future.cancel()
+        raise
+    return submitted
+
+
+def section_result(future):
+    """Return the text of a finished section job, or the failure reply if the job did not run"""
+    try:
+        return future.result()
+    except Exception:
+        # Dropped by the scheduler: expired, preempted or cancelled
+        return BUSY_FALLBACK_RESPONSE
+
+
+def iter_guided_sections(responses, project_type="pm", deadline=None, priority=GUIDED, tenant="anonymous"):
+    """
+    Generate all sections of a guided report concurrently through the scheduler
+    
+    On a scheduler worker the sections are generated one after another in the
+    current job instead, since waiting there for other queued jobs could
+    deadlock the scheduler.
+    
+    Args:
+        responses (dict): The user's responses to the questionnaire
+        project_type (str): The type of project ("pm" or "gp")
+        deadline (Deadline, optional): Request deadline passed to each model call
+        priority (int): Scheduler priority of the section calls
+        tenant (str): Tenant the section calls are charged to
+        
+    Yields:
+        tuple: (index, key, title, text) for each section, in the order they finish
+    """
+    if scheduler.in_worker():
+        sections = PM_GUIDED_SECTIONS if project_type == "pm" else GP_GUIDED_SECTIONS
+        for index, section in enumerate(sections):
+            yield index, section["key"], section["title"], generate_guided_section(
+                section, responses, project_type, deadline
+            )
+        return
+    
+    submitted = submit_guided_sections(responses, project_type, deadline, priority, tenant)
+    futures = {future: (index, section) for index, section, future in submitted}
+    try:
+        for future in as_completed(futures):
+            index, section = futures[future]
+            yield index, section["key"], section["title"], section_result(future)
+    finally:
+        # Sections not started yet are dropped if the caller stops early
+        for future in futures:
+            future.cancel()
+
+
+def section_failed(text):
+    """Whether a section's text is a failure reply rather than content"""
+    return text in (MODEL_ERROR_RESPONSE, BUSY_FALLBACK_RESPONSE)
+
+
+def stitch_guided_sections(sections, project_type="pm"):
+    """
+    Assemble generated sections into the guided report template, in template order
+    
+    A report with a missing section is not a usable answer, so if any section
+    failed the failure reply is returned instead (MODEL_ERROR_RESPONSE when a
+    call failed, BUSY_FALLBACK_RESPONSE when it ran out of time).
+    
+    Args:
+        sections (dict): Section text keyed by section key
+        project_type (str): The type of project ("pm" or "gp")
+        
+    Returns:
+        str: The full report, or the failure reply
+    """
+    for failure in (MODEL_ERROR_RESPONSE, BUSY_FALLBACK_RESPONSE):
+        if failure in sections.values():
+            return failure
+    template = PM_GUIDED_GENERATION_TEMPLATE if project_type == "pm" else GP_GUIDED_GENERATION_TEMPLATE
+    return template.format(**{key: text.strip() for key, text in sections.items()})
+
+
+def process_direct_question(question, chat_history=None, project_type="pm", deadline=None):
     """
     Process a direct question from the user
     
@@ -145,15 +571,48 @@ def process_direct_question(question, chat_history=None, project_type="pm"):
         question (str): The user's question
         chat_history (list, optional): Chat history for contextual responses
         project_type (str): The type of project ("pm" for project management, "gp" for graduation project)
+        deadline (Deadline, optional): Request deadline passed to the model call
         
     Returns:
         str: The model's response
     """
     # If there's chat history, use it directly with the raw question
     if chat_history:
-        return get_openai_response(question, chat_history=chat_history)
+        return get_openai_response(question, chat_history=chat_history, deadline=deadline)
     
     # Otherwise, use the appropriate template
+    return get_openai_response(build_direct_prompt(question, project_type), deadline=deadline)
+
+
+def stream_direct_question(question, chat_history=None, project_type="pm", deadline=None):
+    """
+    Stream the answer to a direct question from the user
+    
+    Args:
+        question (str): The user's question
+        chat_history (list, optional): Chat history for contextual responses
+        project_type (str): The type of project ("pm" for project management, "gp" for graduation project)
+        deadline (Deadline, optional): Request deadline; cancelling it stops the stream
+        
+    Returns:
+        generator: Pieces of the model's response
+    """
+    if chat_history:
+        return stream_openai_response(question, chat_history=chat_history, deadline=deadline)
+    return stream_openai_response(build_direct_prompt(question, project_type), deadline=deadline)
+
+
+def build_direct_prompt(question, project_type="pm"):
+    """
+    Build the first-turn prompt for a direct question
+    
+    Args:
+        question (str): The user's question
+        project_type (str): The type of project ("pm" for project management, "gp" for graduation project)
+        
+    Returns:
+        str: The prompt
+    """
     if project_type == "pm":
         # Determine topic from question for project management
         prompt = PM_DIRECT_MODE_TEMPLATE.format(
@@ -170,5 +629,228 @@ def process_direct_question(question, chat_history=None, project_type="pm"):
     # Add user question for context
     prompt += f"\n\nسؤال المستخدم: {question}"
     
-    return get_openai_response(prompt) 
+    return prompt
+
+
+def detect_project_type(text):
+    """
+    Guess the project type of a question from simple keyword counts
+    
+    Args:
+        text (str): The user's question
+        
+    Returns:
+        str: "pm" or "gp", defaulting to "pm" when unclear
+    """
+    pm_count = sum(1 for kw in PM_KEYWORDS if kw in text)
+    gp_count = sum(1 for kw in GP_KEYWORDS if kw in text)
+    return "gp" if gp_count > pm_count else "pm"
+
+
+# Input limits, shared by the Streamlit app and the API request models
+MAX_QUESTION_CHARS = int(os.getenv("MAX_QUESTION_CHARS", "4000"))
+MAX_ANSWER_CHARS = int(os.getenv("MAX_ANSWER_CHARS", "2000"))
+MAX_ANSWERS = 20
+MAX_HISTORY_MESSAGES = int(os.getenv("MAX_HISTORY_MESSAGES", "100"))
+MAX_MESSAGE_CHARS = int(os.getenv("MAX_MESSAGE_CHARS", "8000"))
+
+# Identical submissions from the same session within this window are not re-generated
+DUPLICATE_WINDOW_SECONDS = int(os.getenv("DUPLICATE_WINDOW_SECONDS", "60"))
+
+_ARABIC_LETTERS = re.compile(r"[\u0600-\u06FF\u0750-\u077F\u08A0-\u08FF\uFB50-\uFDFF\uFE70-\uFEFF]")
+_LATIN_LETTERS = re.compile(r"[A-Za-z\u00C0-\u024F]")
+_ARABIC_DIACRITICS = re.compile(r"[\u064B-\u0652\u0640]")
+# Letters or digits only: runs of spaces or separators are normal in pasted code and tables
+_REPEATED_CHARS = re.compile(r"([^\W_])\1{19,}")
+_PUNCTUATION = re.compile(r"[^\w\s]")
 
+_gate_lock = threading.Lock()
+# Ordered by last update, oldest first, so expired entries are pruned from the front
+_recent_submissions = OrderedDict()
+gate_stats = {
+    "checked": 0,
+    "passed": 0,
+    "empty": 0,
+    "too_long": 0,
+    "unsupported_language": 0,
+    "spam": 0,
+    "greeting": 0,
+    "duplicate": 0,
+}
+
+
+def _count(reason):
+    with _gate_lock:
+        gate_stats["checked"] += 1
+        gate_stats[reason] += 1
+
+
+def get_gate_stats():
+    """
+    Return the input gate counters
+
+    Returns:
+        dict: Counters per gate outcome, including how many model calls were avoided
+    """
+    with _gate_lock:
+        stats = dict(gate_stats)
+    stats["calls_avoided"] = stats["checked"] - stats["passed"]
+    return stats
+
+
+def normalize_text(text):
+    """Normalize Arabic/English text for phrase matching"""
+    text = _ARABIC_DIACRITICS.sub("", text.strip().lower())
+    text = re.sub("[أإآ]", "ا", text).replace("ة", "ه").replace("ى", "ي")
+    return " ".join(_PUNCTUATION.sub(" ", text).split())
+
+
+def detect_script(text):
+    """
+    Detect the dominant script of a text
+
+    Args:
+        text (str): The text to inspect
+
+    Returns:
+        str: "arabic", "latin", "other" or "none" when the text has no letters
+    """
+    arabic = len(_ARABIC_LETTERS.findall(text))
+    latin = len(_LATIN_LETTERS.findall(text))
+    letters = sum(1 for ch in text if ch.isalpha())
+    if letters == 0:
+        return "none"
+    if arabic + latin < letters / 2:
+        return "other"
+    return "arabic" if arabic >= latin else "latin"
+
+
+def history_digest(chat_history):
+    """Return a short digest identifying a chat history, "" when there is none"""
+    if not chat_history:
+        return ""
+    digest = hashlib.sha1()
+    for msg in chat_history:
+        digest.update(f"{msg['role']}\x01{msg['content']}\x00".encode("utf-8"))
+    return f"{len(chat_history)}:{digest.hexdigest()}"
+
+
+def _forget_expired(now):
+    # Called with _gate_lock held; stops at the first submission still in the window
+    while _recent_submissions:
+        key, (seen, _) = next(iter(_recent_submissions.items()))
+        if now - seen <= DUPLICATE_WINDOW_SECONDS:
+            break
+        del _recent_submissions[key]
+
+
+def _submission_key(session_id, text, chat_history=None):
+    # The same question after a different conversation is a new submission
+    return session_id, hashlib.sha1(text.encode("utf-8")).hexdigest(), history_digest(chat_history)
+
+
+def gate_input(text, session_id=None, max_chars=MAX_QUESTION_CHARS, canned_replies=True, chat_history=None):
+    """
+    Cheap checks run before a model call
+
+    Args:
+        text (str): The user's input
+        session_id (str, optional): Session used for duplicate-submit detection.
+            Without one, duplicates are not detected.
+        max_chars (int): Maximum accepted input length
+        canned_replies (bool): Answer greetings and thanks without the model
+        chat_history (list, optional): Chat history the input is sent with
+
+    Returns:
+        tuple: (reply, reason). reply is None when the input should go to the
+            model, otherwise it is the canned reply to show instead.
+    """
+    stripped = (text or "").strip()
+    if not stripped:
+        _count("empty")
+        return EMPTY_INPUT_RESPONSE, "empty"
+    if len(stripped) > max_chars:
+        _count("too_long")
+        return TOO_LONG_INPUT_RESPONSE, "too_long"
+
+    script = detect_script(stripped)
+    if script == "none" or _REPEATED_CHARS.search(stripped):
+        _count("spam")
+        return SPAM_INPUT_RESPONSE, "spam"
+    if script == "other":
+        _count("unsupported_language")
+        return UNSUPPORTED_LANGUAGE_RESPONSE, "unsupported_language"
+
+    normalized = normalize_text(stripped)
+    if canned_replies and normalized in GREETING_PHRASES:
+        _count("greeting")
+        return GREETING_RESPONSE, "greeting"
+    if canned_replies and normalized in THANKS_PHRASES:
+        _count("greeting")
+        return THANKS_RESPONSE, "greeting"
+
+    if session_id is not None:
+        key = _submission_key(session_id, normalized, chat_history)
+        now = time.monotonic()
+        with _gate_lock:
+            _forget_expired(now)
+            previous = _recent_submissions.get(key)
+            if previous is None:
+                _recent_submissions[key] = (now, None)
+        if previous is not None:
+            _count("duplicate")
+            return previous[1] or DUPLICATE_PENDING_RESPONSE, "duplicate"
+
+    _count("passed")
+    return None, "passed"
+
+
+def _answers_text(responses):
+    return "\n".join(value.strip() for value in responses.values() if value and value.strip())
+
+
+def gate_questionnaire(responses, session_id=None):
+    """
+    Cheap checks run on questionnaire answers before a model call
+
+    Args:
+        responses (dict): The user's responses to the questionnaire
+        session_id (str, optional): Session used for duplicate-submit detection
+
+    Returns:
+        tuple: (responses, reply, reason). responses has empty answers removed;
+            reply is None when the model should be called.
+    """
+    answered = {key: value.strip() for key, value in responses.items() if value and value.strip()}
+    reply, reason = gate_input(
+        _answers_text(answered),
+        session_id=session_id,
+        max_chars=MAX_ANSWER_CHARS * MAX_ANSWERS,
+        canned_replies=False
+    )
+    return answered, reply, reason
+
+
+def remember_response(session_id, text, response, chat_history=None):
+    """
+    Store the generated response for a submission so a duplicate submit within
+    the window gets it back without another model call
+
+    Args:
+        session_id (str): Session the submission came from
+        text (str or dict): The question, or the questionnaire responses
+        response (str): The generated response. Failed generations are
+            forgotten so the user can retry right away.
+        chat_history (list, optional): Chat history the question was sent with
+    """
+    if session_id is None:
+        return
+    if isinstance(text, dict):
+        text = _answers_text(text)
+    key = _submission_key(session_id, normalize_text(text.strip()), chat_history)
+    with _gate_lock:
+        if response is None or response in (MODEL_ERROR_RESPONSE, BUSY_FALLBACK_RESPONSE):
+            _recent_submissions.pop(key, None)
+        else:
+            _recent_submissions[key] = (time.monotonic(), response)
+            _recent_submissions.move_to_end(key)